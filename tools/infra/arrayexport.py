@@ -0,0 +1,94 @@
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+"""
+Columnar export of the mined results, for the plotting scripts.
+
+Each (target, workercount) gets a directory, and each trial of it a
+subdirectory named after its test directory and tgcount. The arrays are
+written as separate .npy files rather than a .npz archive, so they can be
+memory mapped instead of read: see loadArrays. NumPy is optional, the
+miners only use this module when asked.
+"""
+
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def isAvailable():
+    return numpy is not None
+
+def getExportDir(outdir, target, workercount, trial=None):
+    """Returns the directory of a (target, workercount) or, with a
+    (testdir, tgcount) trial, the directory of the trial."""
+    dirname = os.path.join(outdir, target, "%d" % workercount)
+    if trial:
+        dirname = os.path.join(dirname, "%s-%d" % trial)
+    return dirname
+
+def saveArrays(dirname, arrays):
+    """Writes a dictionary of arrays (or of lists and numbers, converted
+    to arrays) to dirname, one name.npy file per array. The files are
+    renamed in place once complete, so a reader never maps a partial
+    file."""
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    for name, array in arrays.iteritems():
+        path = os.path.join(dirname, "%s.npy" % name)
+        f = open(path + ".tmp", "wb")
+        numpy.save(f, numpy.ascontiguousarray(numpy.asarray(array)))
+        f.close()
+        os.rename(path + ".tmp", path)
+
+def loadArrays(dirname, mmap=True):
+    """Returns the dictionary of the arrays of a directory. By default the
+    arrays are read-only memory maps of the files."""
+    arrays = { }
+    for fname in sorted(os.listdir(dirname)):
+        if fname.endswith(".npy"):
+            arrays[fname[:-len(".npy")]] = numpy.load(os.path.join(dirname, fname),
+                                                      mmap_mode="r" if mmap else None)
+    return arrays
+
+def listTrials(outdir, target, workercount):
+    """Returns the (testdir, tgcount) trials exported for a (target,
+    workercount)."""
+    dirname = getExportDir(outdir, target, workercount)
+    trials = []
+    for name in sorted(os.listdir(dirname)):
+        if os.path.isdir(os.path.join(dirname, name)):
+            testdir, tgcount = name.rsplit("-", 1)
+            trials.append((testdir, int(tgcount)))
+    return trials
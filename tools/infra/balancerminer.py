@@ -0,0 +1,303 @@
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+import sys
+import subprocess
+import re
+import math
+import itertools
+import bisect
+
+from common import readHosts, AverageEntry, runParallel, runAgent
+from common import readLines, TransferMeter, getSSHCounters
+from common import DEFAULT_JOBS
+from subprocess import PIPE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_BUCKETSIZE = 10
+
+class BalanceTimeLine:
+    def __init__(self):
+        self.totals = []
+        self.transfers = []
+
+class BalanceAverage:
+    def __init__(self, bucketsize):
+        self.completion = AverageEntry()
+        self.bucketsize = bucketsize
+        self.xferratio = { }
+
+
+class BalancerMiner:
+    def __init__(self, hostsName, hfilter=None, compress=False, remote=False):
+        self.hosts, self.localhost = readHosts(hostsName)
+        self.hfilter = set(hfilter) if hfilter else None
+        self.compress = compress
+        self.remote = remote
+
+        self.pathRe = re.compile(r"^./([^/]+)/([^/-]+)-(\d+)(-(\d+))?/out-lb.txt$")
+        self.totalRe = re.compile(r"^\[([\d.]+)\].*\[(\d+)\] IN TOTAL$")
+        self.transferRe = re.compile(r"\[([\d.]+)\].*from (\d+) to (\d+) for (\d+) states$")
+
+    def _logMsg(self, msg):
+        print >>sys.stderr, "-- %s" % msg
+
+    def analyzeExperiments(self, explist, skip=1, jobs=None, bucketsize=DEFAULT_BUCKETSIZE):
+        """Mines the load balancer logs of the controller and, if remote,
+        of the cluster machines. Each machine reads its logs in a single
+        pass, with a pool of jobs processes (one per core by default)."""
+        balancedb = { }
+
+        hosts = [None]
+        if self.remote:
+            hosts.extend(sorted(host for host in self.hosts
+                                if not self.hfilter or host in self.hfilter))
+
+        def pollHost(host):
+            hostdb = { }
+            self._pollLogs(host, explist, hostdb, skip=skip, jobs=jobs)
+            return hostdb
+
+        for host, hostdb, error in runParallel(pollHost, hosts, jobs=DEFAULT_JOBS):
+            if error:
+                self._logMsg("NOTE: Cannot mine the balancer logs on host '%s', error: %s" % (
+                        host or "localhost", error))
+                continue
+            self._mergeTimelines(balancedb, hostdb)
+
+        if self.remote:
+            self._logMsg("SSH connections: %d opened, %d reused." % getSSHCounters())
+
+        self.balancedb = balancedb
+        self.resolution = "every-%d" % skip
+
+        avgdb = self._averageData(balancedb, bucketsize=bucketsize)
+
+        return avgdb
+
+    def loadExperiments(self, warehouse, explist=None, since=None, until=None,
+                        bucketsize=DEFAULT_BUCKETSIZE):
+        """Same as analyzeExperiments, with the balancer timelines stored in
+        a results warehouse instead of the logs. Without a list of tests,
+        all the stored experiments are loaded."""
+        balancedb = { }
+
+        rank = lambda resolution: int(resolution[len("every-"):])
+        for kind in ("lbtotals", "lbtransfers"):
+            for key, _, rows in warehouse.load(kind, rank=rank, testdirs=explist,
+                                               since=since, until=until):
+                testdir, target, workercount, tgcount, _ = key
+                tgdata = balancedb.setdefault(target, {})
+                expdata = tgdata.setdefault((testdir, tgcount), {})
+                timeline = expdata.setdefault(workercount, BalanceTimeLine())
+                if kind == "lbtotals":
+                    timeline.totals = rows
+                else:
+                    timeline.transfers = rows
+
+        self.balancedb = balancedb
+        avgdb = self._averageData(balancedb, bucketsize=bucketsize)
+
+        return avgdb
+
+    def ingestResults(self, warehouse):
+        """Stores the timelines mined by analyzeExperiments in a results
+        warehouse, one timeline per experiment."""
+        def getRecords(attr):
+            for target, exps in sorted(self.balancedb.iteritems()):
+                for (testdir, tgcount), exp in sorted(exps.iteritems()):
+                    for workercount, timeline in sorted(exp.iteritems()):
+                        yield None, (testdir, target, workercount, tgcount, 0), getattr(timeline, attr)
+
+        count = warehouse.ingest("lbtotals", getRecords("totals"), resolution=self.resolution)
+        warehouse.ingest("lbtransfers", getRecords("transfers"), resolution=self.resolution)
+        self._logMsg("Stored %d balancer timeline(s) in %s." % (count, warehouse.path))
+
+    def _pollLogs(self, host, testdirs, balancedb, skip=1, jobs=None):
+        config = {
+            "mode": "balancer",
+            "testdirs": testdirs,
+            "skip": skip,
+            "jobs": jobs
+            }
+        if host is None:
+            proc = runAgent(self.localhost, config, compress=self.compress, local=True, stdout=PIPE)
+        else:
+            proc = runAgent(self.hosts[host], config, compress=self.compress, stdout=PIPE)
+
+        meter = TransferMeter()
+        self._parseLogs(readLines(proc.stdout, compressed=self.compress, meter=meter), balancedb)
+        proc.wait()
+        self._logMsg("Received %s from %s." % (meter, host or "localhost"))
+
+        if proc.returncode != 0:
+            self._logMsg("NOTE: Mining failed on host '%s' (exit code %d), using partial results." % (
+                    host or "localhost", proc.returncode))
+
+    def _parseLogs(self, lines, balancedb):
+        for line in lines:
+            match = self.pathRe.match(line)
+            if match:
+                testdir, target, workercount, _, tgcount = match.groups()
+                workercount = int(workercount)
+                tgcount = int(tgcount) if tgcount else 1
+
+                tgdata = balancedb.setdefault(target, {})
+                expdata = tgdata.setdefault((testdir, tgcount), {})
+                timeline = expdata.setdefault(workercount, BalanceTimeLine())
+                continue
+            
+            match = self.totalRe.match(line)
+            if match:
+                timestamp, total = float(match.group(1)), int(match.group(2))
+                timeline.totals.append((timestamp, total))
+                continue
+
+            match = self.transferRe.match(line)
+            if match:
+                timestamp = float(match.group(1))
+                amount = int(match.group(4))
+                timeline.transfers.append((timestamp, amount))
+
+                if amount > 0:
+                    if timeline.transfers and abs(timeline.transfers[-1][0] - timestamp) < 0.01:
+                        timeline.transfers[-1] = (timestamp, amount + timeline.transfers[-1][1])
+                    else:
+                        timeline.transfers.append((timestamp, amount))
+
+                continue
+
+            self._logMsg("Unprocessed line: '%s'" % line)
+
+    def _mergeTimelines(self, balancedb, hostdb):
+        for target, exps in hostdb.iteritems():
+            tgdata = balancedb.setdefault(target, {})
+            for tgtrial, exp in exps.iteritems():
+                expdata = tgdata.setdefault(tgtrial, {})
+                for workercount, timeline in exp.iteritems():
+                    merged = expdata.setdefault(workercount, BalanceTimeLine())
+                    merged.totals.extend(timeline.totals)
+                    merged.transfers.extend(timeline.transfers)
+
+    def _averageData(self, balancedb, bucketsize=DEFAULT_BUCKETSIZE):
+        avgdb = { }
+        for target, exps in balancedb.iteritems():
+            tgdata = avgdb.setdefault(target, {})
+            for tgtrial, exp in exps.iteritems():
+                for workercount, timeline in exp.iteritems():
+                    average = tgdata.setdefault(workercount, BalanceAverage(bucketsize))
+                    # Search for the completion time, if any...
+                    try:
+                        completion = (entry[0] for entry in timeline.totals if entry[1] == 0).next()
+                        average.completion.entries.append(completion)
+                    except StopIteration:
+                        completion = None
+
+                    if numpy:
+                        buckets = self._computeBucketsVectorized(timeline, bucketsize)
+                    else:
+                        buckets = self._computeBuckets(timeline, bucketsize)
+
+                    # Fix this for "gaps" in the buckets
+                    for key, (total, count) in buckets.iteritems():
+                        avgbucket = average.xferratio.setdefault(key, AverageEntry())
+                        avgbucket.entries.append(total/count)
+
+            for workercount, average in tgdata.iteritems():
+                average.completion.computeAverage()
+                for xferavg in average.xferratio.itervalues():
+                    xferavg.computeAverage()
+
+        return avgdb
+
+    def _computeBuckets(self, timeline, bucketsize):
+        """Sums the transfer ratios of a timeline per bucket. A transfer is
+        related to the last total logged before it. Returns a dictionary of
+        [sum, count] lists indexed by bucket."""
+        buckets = { }
+        tottimes = [entry[0] for entry in timeline.totals]
+        for timestamp, amount in timeline.transfers:
+            index = bisect.bisect_left(tottimes, timestamp) - 1
+            if index < 0 or not timeline.totals[index][1]:
+                continue
+            bucket = buckets.get(int(timestamp // bucketsize))
+            ratio = 100.0*amount/timeline.totals[index][1]
+            if bucket:
+                bucket[0] += ratio
+                bucket[1] += 1
+            else:
+                buckets[int(timestamp // bucketsize)] = [ratio, 1]
+
+        return buckets
+
+    def _toColumns(self, pairs):
+        values = numpy.fromiter(itertools.chain.from_iterable(pairs), dtype=numpy.float64,
+                                count=2*len(pairs))
+        return values[0::2], values[1::2]
+
+    def _computeBucketsVectorized(self, timeline, bucketsize):
+        """Same as _computeBuckets, with NumPy. The sums are accumulated in
+        the same order, so the results are the same."""
+        if not timeline.transfers or not timeline.totals:
+            return { }
+        tottimes, totals = self._toColumns(timeline.totals)
+        times, amounts = self._toColumns(timeline.transfers)
+
+        indices = numpy.searchsorted(tottimes, times, side="left") - 1
+        valid = indices >= 0
+        valid[valid] = totals[indices[valid]] != 0
+        ratios = 100.0*amounts[valid]/totals[indices[valid]]
+
+        keys, groups = numpy.unique(numpy.floor_divide(times[valid], bucketsize), return_inverse=True)
+        sums = numpy.bincount(groups, weights=ratios)
+        counts = numpy.bincount(groups)
+        return dict((int(key), (float(total), int(count)))
+                    for key, total, count in zip(keys, sums, counts))
+
+    def printAverages(self, avgdb, target="memcached"):
+        tgdata = avgdb[target]
+        for workercount in sorted(tgdata.keys()):
+            average = tgdata[workercount]
+            print "%d: %s" % (workercount,
+                              "%d" % int(average.completion.average) if average.completion.average else "-"),
+            for k in sorted(average.xferratio):
+                avgval = average.xferratio[k]
+                print "%d=%.2f,%.2f(%d)" % (
+                    k,
+                    avgval.average,
+                    avgval.stdev,
+                    len(avgval.entries)
+                    ),
+            print
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+"""
+Benchmarks the miners against a tree written by gen-benchmark.py.
+
+Each miner runs in its own process from the benchmark directory, reading
+the files locally: the coverage and stats miners in local mode, and the
+balancer miner through the mining agent of the local host. No ssh is
+involved. The wall time, peak RSS and lines mined per second are reported,
+and can be saved and compared against a previous run.
+"""
+
+import os
+import sys
+import json
+import time
+import subprocess
+
+from argparse import ArgumentParser
+
+MINERS = ["coverage", "stats", "balancer"]
+DEFAULT_TOLERANCE = 20
+
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _logMsg(msg):
+    print >>sys.stderr, "-- %s" % msg
+
+def getCommand(miner, manifest):
+    testdir = manifest["testdir"]
+    target = manifest["targets"][0]
+    if miner == "coverage":
+        script, args = "mine-coverage.py", [manifest["hosts"], testdir, "-l", "--no-cache",
+                                            "-c", target, "50", "90"]
+    elif miner == "stats":
+        script, args = "mine-stats.py", [manifest["hosts"], target, testdir, "-l", "--no-cache"]
+    else:
+        script, args = "mine-balancer.py", [manifest["hosts"], testdir]
+    return [sys.executable, os.path.join(_SCRIPTS_DIR, script)] + args
+
+def runMiner(command, benchdir):
+    """Runs a miner to completion. Returns its wall time, in seconds, and
+    its peak RSS, in MB, including the processes it waited for."""
+    null = open(os.devnull, "w")
+    start = time.time()
+    proc = subprocess.Popen(command, cwd=benchdir, stdout=null, stderr=null)
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall = time.time() - start
+    null.close()
+
+    if status != 0:
+        raise RuntimeError("'%s' failed with status %d" % (" ".join(command), status))
+    return wall, usage.ru_maxrss / 1024.
+
+def benchmark(benchdir, miners, repeat=1):
+    """Returns {miner: {"wall", "rss", "lines/s"}}, with the best wall time
+    and the highest peak RSS of the runs."""
+    f = open(os.path.join(benchdir, "bench.json"), "r")
+    manifest = json.load(f)
+    f.close()
+
+    results = { }
+    for miner in miners:
+        walls, rsses = [], []
+        for run in range(repeat):
+            _logMsg("Running the %s miner (%d/%d)..." % (miner, run + 1, repeat))
+            wall, rss = runMiner(getCommand(miner, manifest), benchdir)
+            walls.append(wall)
+            rsses.append(rss)
+        results[miner] = {
+            "wall": min(walls),
+            "rss": max(rsses),
+            "lines/s": manifest["lines"][miner] / min(walls)
+            }
+    return results
+
+def compareResults(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Returns the list of (miner, metric, old, new) regressions larger
+    than tolerance percent."""
+    regressions = []
+    for miner in sorted(results):
+        if miner not in baseline:
+            continue
+        for metric in ("wall", "rss"):
+            old, new = baseline[miner][metric], results[miner][metric]
+            if new > old * (1 + tolerance / 100.):
+                regressions.append((miner, metric, old, new))
+    return regressions
+
+def printResults(results, baseline=None):
+    print "%10s %10s %10s %12s" % ("Miner", "Wall (s)", "RSS (MB)", "Lines/s"),
+    if baseline:
+        print "%10s %10s" % ("Wall diff", "RSS diff"),
+    print
+    print "="*(46 + (22 if baseline else 0))
+    for miner in MINERS:
+        if miner not in results:
+            continue
+        result = results[miner]
+        print "%10s %10.2f %10.1f %12d" % (miner, result["wall"], result["rss"], result["lines/s"]),
+        if baseline and miner in baseline:
+            print "%9.1f%% %9.1f%%" % tuple(
+                100. * (result[metric] - baseline[miner][metric]) / baseline[miner][metric]
+                for metric in ("wall", "rss")),
+        print
+
+def main():
+    parser = ArgumentParser(description="Benchmark the Cloud9 experiment miners.")
+    parser.add_argument("benchdir", help="Directory generated by gen-benchmark.py")
+    parser.add_argument("miners", nargs="*",
+                        help="Miners to benchmark, among %s (all by default)" % ", ".join(MINERS))
+    parser.add_argument("-r", "--repeat", type=int, default=1,
+                        help="Run each miner the specified number of times, and keep the best time")
+    parser.add_argument("--save", help="Save the results to the specified JSON file")
+    parser.add_argument("--compare", help="Compare the results to the ones saved in the specified file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="With --compare, fail on wall time or RSS increases above the "
+                        "specified percentage")
+
+    args = parser.parse_args()
+    for miner in args.miners:
+        if miner not in MINERS:
+            parser.error("unknown miner '%s'" % miner)
+    benchdir = os.path.abspath(args.benchdir)
+
+    results = benchmark(benchdir, args.miners or MINERS, repeat=args.repeat)
+
+    baseline = None
+    if args.compare:
+        f = open(args.compare, "r")
+        baseline = json.load(f)
+        f.close()
+    printResults(results, baseline)
+
+    if args.save:
+        f = open(args.save, "w")
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.close()
+
+    if baseline:
+        regressions = compareResults(results, baseline, tolerance=args.tolerance)
+        for miner, metric, old, new in regressions:
+            _logMsg("REGRESSION: %s %s went from %.2f to %.2f." % (miner, metric, old, new))
+        if regressions:
+            exit(1)
+
+if __name__ == "__main__":
+    main()
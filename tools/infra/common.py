@@ -34,9 +34,22 @@ Common functionality across all the Python scripts.
 """
 
 import subprocess
+import os
+import os.path
+import atexit
+import tempfile
+import shutil
 import math
 import re
 import glob
+import threading
+import traceback
+import time
+import zlib
+import mmap
+import collections
+
+from multiprocessing.pool import ThreadPool
 
 _HOSTS_DIR = "./hosts"
 _CMDLINES_DIR = "./cmdlines"
@@ -44,12 +57,22 @@ _EXP_DIR = "./exp"
 _KLEECMD_DIR = "./kleecmd"
 _COVERABLE_DIR = "./coverable"
 _REJECTED_DIR = "./rejects"
+_AGENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mineagent.py")
+
+DEFAULT_JOBS = 8
+READ_CHUNK_SIZE = 65536
+SCAN_BLOCK_SIZE = 4 << 20
+DEFAULT_SSH_PERSIST = 600
+SSH_SESSIONS_PER_MASTER = 10 # The default MaxSessions of sshd
+
+_GZIP_HEADER = "C9-GZIP"
+_PLAIN_HEADER = "C9-PLAIN"
 
 _REJECTION_RE = re.compile(r"([^/]+)/([^/-]+)-(\d+)(-(\d+))?")
 
 
-def _getRejections():
-    rejections = set()
+def _loadRejections():
+    rejections = { }
 
     files = glob.glob("%s/*.txt" % _REJECTED_DIR)
     for fileName in files:
@@ -66,11 +89,22 @@ def _getRejections():
             workercount = int(workercount)
             tgcount = int(tgcount) if tgcount else 1
             
-            rejections.add((testdir, target, workercount, tgcount))
+            rejections.setdefault(testdir, set()).add((target, workercount, tgcount))
 
     return rejections
-            
-_REJECTIONS = _getRejections()
+
+_REJECTIONS = None
+_REJECTIONS_LOCK = threading.Lock()
+
+def _getRejections():
+    """Returns the rejected experiments, as a dictionary of (target,
+    workercount, tgcount) sets indexed by test directory. The rejection
+    files are only read on first use."""
+    global _REJECTIONS
+    with _REJECTIONS_LOCK:
+        if _REJECTIONS is None:
+            _REJECTIONS = _loadRejections()
+    return _REJECTIONS
 
 class AverageEntry:
     def __init__(self):
@@ -119,6 +153,483 @@ def _getKleeCmdPath(kleeCmd):
 def runBashScript(script, **extra):
     return subprocess.Popen(["/bin/bash", "-c", script], **extra)
 
+class SSHPool:
+    """Keeps persistent ssh master connections and multiplexes the ssh and
+    scp sessions of all the tools over them, instead of paying a new
+    handshake for each session.
+
+    There is one master per (user, host, slot). Callers that keep many
+    sessions open at once on the same host spread them over several slots,
+    since sshd accepts at most SSH_SESSIONS_PER_MASTER sessions per
+    connection. The masters are shut down when the process exits."""
+
+    def __init__(self, persist=DEFAULT_SSH_PERSIST):
+        self.persist = persist
+        self.controldir = None
+        self.masters = set()
+        self.lastUse = { }
+        self.opened = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+        self._masterLocks = { }
+
+    def _getControlPath(self, user, host, slot):
+        self._lock.acquire()
+        try:
+            if self.controldir is None:
+                self.controldir = tempfile.mkdtemp(prefix="c9-ssh-")
+                atexit.register(self.close)
+        finally:
+            self._lock.release()
+        return os.path.join(self.controldir, "%s@%s-%d" % (user, host, slot))
+
+    def _runControl(self, args):
+        null = open(os.devnull, "r+")
+        code = subprocess.call(["ssh"] + args, stdin=null, stdout=null, stderr=null)
+        null.close()
+        return code
+
+    def getOptions(self, user, host, slot=0, options=""):
+        """Returns the ssh/scp options that route a session through the
+        master connection, opening the master if needed."""
+        key = (user, host, slot)
+        controlPath = self._getControlPath(user, host, slot)
+        destination = "%s@%s" % (user, host)
+
+        self._lock.acquire()
+        masterLock = self._masterLocks.setdefault(key, threading.Lock())
+        self._lock.release()
+
+        # Open the master here rather than from the session itself: the
+        # sessions run with their output piped, and a master forked from
+        # them would keep the pipe open
+        masterLock.acquire()
+        try:
+            now = time.time()
+            alive = key in self.masters
+            if alive and now - self.lastUse[key] > self.persist / 2:
+                # The master may have been idle long enough to go away
+                alive = self._runControl(["-O", "check", "-o", "ControlPath=%s" % controlPath,
+                                          destination]) == 0
+            if alive:
+                self.reused += 1
+            elif self._runControl(options.split() + [
+                    "-o", "ControlMaster=auto", "-o", "ControlPath=%s" % controlPath,
+                    "-o", "ControlPersist=%d" % self.persist, destination, "true"]) == 0:
+                self.masters.add(key)
+                self.opened += 1
+            else:
+                self.masters.discard(key)
+            self.lastUse[key] = now
+        finally:
+            masterLock.release()
+
+        # Without a master, ssh falls back to a direct connection
+        return ("%s -o ControlMaster=no -o ControlPath=%s" % (options, controlPath)).strip()
+
+    def close(self):
+        for user, host, slot in self.masters:
+            self._runControl(["-O", "exit", "-o", "ControlPath=%s" % self._getControlPath(user, host, slot),
+                              "%s@%s" % (user, host)])
+        self.masters.clear()
+        if self.controldir:
+            shutil.rmtree(self.controldir, ignore_errors=True)
+            self.controldir = None
+
+_SSH_POOL = SSHPool()
+
+def sshCommand(user, host, slot=0, options=""):
+    """Returns an ssh command line for the host that goes through the
+    shared connection pool."""
+    return "ssh %s %s@%s" % (_SSH_POOL.getOptions(user, host, slot, options), user, host)
+
+def scpCommand(user, host, slot=0, options=""):
+    """Returns an scp command (without the file arguments) that goes
+    through the shared connection pool."""
+    return "scp %s" % _SSH_POOL.getOptions(user, host, slot, options)
+
+def getSSHCounters():
+    """Returns the number of ssh connections opened and the number of
+    sessions that reused an open connection."""
+    return _SSH_POOL.opened, _SSH_POOL.reused
+
+class SSHTransport:
+    """Runs the commands of a host over ssh, through the shared connection
+    pool."""
+
+    def __init__(self, hostEntry):
+        self.user = hostEntry["user"]
+        self.host = hostEntry["host"]
+        self.address = hostEntry["host"]
+
+    def shellCommand(self, command, slot=0, options=""):
+        """Returns a local command line running the shell command (which
+        must fit in single quotes) on the host, with the same stdin."""
+        return "%s '%s'" % (sshCommand(self.user, self.host, slot=slot, options=options), command)
+
+    def copyCommand(self, source, dest, slot=0, options=""):
+        """Returns a command line copying a local file to the host."""
+        return "%s %s %s@%s:%s" % (scpCommand(self.user, self.host, slot=slot, options=options),
+                                   source, self.user, self.host, dest)
+
+class LocalTransport:
+    """Runs the commands of a host as local processes. Several hosts can
+    be simulated on this machine this way, each with its own directories,
+    and their workers listen on the loopback interface."""
+
+    def __init__(self, hostEntry):
+        self.host = hostEntry["host"]
+        self.address = "127.0.0.1"
+
+    def shellCommand(self, command, slot=0, options=""):
+        return "bash -c '%s'" % command
+
+    def copyCommand(self, source, dest, slot=0, options=""):
+        return "cp %s %s" % (source, dest)
+
+TRANSPORTS = {
+    "ssh": SSHTransport,
+    "local": LocalTransport
+    }
+
+def getTransport(hostEntry):
+    """Returns the transport of a host, set by the optional last column of
+    the hosts file (ssh by default)."""
+    return TRANSPORTS[hostEntry.get("transport", "ssh")](hostEntry)
+
+def killAfter(proc, timeout):
+    """Kills the process if it is still running after the timeout (in
+    seconds) expires. Returns the timer, which the caller should cancel
+    once the process is done."""
+    def expire():
+        if proc.poll() is None:
+            proc.timedout = True
+            # The ssh client is usually a child of the bash wrapper, and it
+            # holds the output pipe open
+            subprocess.call(["pkill", "-KILL", "-P", str(proc.pid)])
+            proc.kill()
+
+    proc.timedout = False
+    timer = threading.Timer(timeout, expire)
+    timer.daemon = True
+    if timeout:
+        timer.start()
+    return timer
+
+class TransferMeter:
+    """Counts the bytes received from a remote command, before and after
+    decompression."""
+    def __init__(self):
+        self.received = 0
+        self.decoded = 0
+        self.compressed = False
+        self.starttime = time.time()
+
+    def __str__(self):
+        elapsed = max(time.time() - self.starttime, 1e-6)
+        return "%d bytes%s in %.2f s (%d bytes/s)" % (
+            self.received,
+            (" (%d uncompressed)" % self.decoded) if self.compressed else "",
+            elapsed, self.received / elapsed)
+
+def wrapRemoteCommand(command, compress=False):
+    """Makes a remote shell command send its output through gzip, when the
+    remote host has it. The output then starts with a header line telling
+    whether it is compressed. The result fits in single quotes."""
+    if not compress:
+        return command
+    return ("if command -v gzip >/dev/null 2>&1; then echo %(gzip)s; %(command)s | gzip -c -1; "
+            "else echo %(plain)s; %(command)s; fi") % {
+        "gzip": _GZIP_HEADER,
+        "plain": _PLAIN_HEADER,
+        "command": command
+        }
+
+def _readChunks(stream, meter=None):
+    fd = stream.fileno()
+    while True:
+        chunk = os.read(fd, READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        if meter:
+            meter.received += len(chunk)
+        yield chunk
+
+def _decodeChunks(chunks, meter=None):
+    """Strips the header added by wrapRemoteCommand and decompresses the
+    rest of the stream, if needed."""
+    header = ""
+    for chunk in chunks:
+        header += chunk
+        if "\n" in header:
+            break
+    header, _, data = header.partition("\n")
+
+    if header.strip() == _GZIP_HEADER:
+        if meter:
+            meter.compressed = True
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in [data] if data else []:
+            yield decompressor.decompress(chunk)
+        for chunk in chunks:
+            yield decompressor.decompress(chunk)
+        yield decompressor.flush()
+    else:
+        yield data
+        for chunk in chunks:
+            yield chunk
+
+def readLines(stream, compressed=False, meter=None):
+    """Yields the lines of a pipe, without the trailing newline, as soon as
+    they arrive. Memory use is bounded by the read size and the longest
+    line. If compressed is set, the stream comes from a command wrapped by
+    wrapRemoteCommand."""
+    chunks = _readChunks(stream, meter)
+    if compressed:
+        chunks = _decodeChunks(chunks, meter)
+
+    pending = ""
+    for chunk in chunks:
+        if meter:
+            meter.decoded += len(chunk)
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+
+    if pending:
+        yield pending
+
+def runParallel(func, items, jobs=DEFAULT_JOBS):
+    """Calls func on each item, running at most jobs calls at a time.
+
+    Returns a list of (item, result, error) tuples, in the order of the
+    items. The error is the formatted traceback if the call raised, or None.
+    """
+    items = list(items)
+    results = [None] * len(items)
+
+    def runItem(index):
+        try:
+            results[index] = (items[index], func(items[index]), None)
+        except Exception:
+            results[index] = (items[index], None, traceback.format_exc())
+
+    if jobs <= 1 or len(items) <= 1:
+        for index in range(len(items)):
+            runItem(index)
+        return results
+
+    pool = ThreadPool(min(jobs, len(items)))
+    try:
+        pool.map(runItem, range(len(items)))
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+def listRemoteFiles(hostEntry, testdirs, name, timeout=None):
+    """Returns the list of (path, size, mtime) of the files with the given
+    name under the test directories of a host. The paths are relative to the
+    experiment directory of the host (./<testdir>/...). The directories of
+    rejected experiments are not searched."""
+    finds = []
+    for testdir in testdirs:
+        prune = " -o ".join("-path ./%s/%s" % (testdir, d) for d in getRejectedDirs(testdir))
+        finds.append("find ./%s %s-name '%s' -printf '%%p %%s %%T@\\n'" % (
+                testdir, "\\( %s \\) -prune -o " % prune if prune else "", name))
+
+    proc = runBashScript("""
+       %(shell)s <<'EOF'
+       cd %(expdir)s
+       # The code below is run remotely
+       %(finds)s
+       \nEOF""" % {
+            "shell": getTransport(hostEntry).shellCommand("bash -s"),
+            "expdir": hostEntry["expdir"],
+            "finds": "\n".join(finds)
+            }, stdout=subprocess.PIPE)
+
+    timer = killAfter(proc, timeout)
+    files = []
+    for line in readLines(proc.stdout):
+        tokens = line.split()
+        if len(tokens) != 3:
+            continue
+        files.append((tokens[0], int(tokens[1]), tokens[2]))
+    proc.wait()
+    timer.cancel()
+
+    return files
+
+def getDistinctLocalHosts(hosts, names):
+    """Returns the hosts among names to mine in local mode, one per
+    experiment directory. On a shared filesystem, all the hosts have the
+    same directory, which is then only read for the first of them."""
+    expdirs = set()
+    distinct = []
+    for host in sorted(names):
+        expdir = os.path.realpath(hosts[host]["expdir"])
+        if expdir in expdirs:
+            continue
+        expdirs.add(expdir)
+        distinct.append(host)
+    return distinct
+
+def listLocalFiles(hostEntry, testdirs, name):
+    """Same as listRemoteFiles, for a host whose experiment directory is
+    mounted locally at the same path."""
+    files = []
+    for testdir in testdirs:
+        root = os.path.join(hostEntry["expdir"], testdir)
+        rejected = set(getRejectedDirs(testdir))
+        for dirpath, dirnames, filenames in os.walk(root):
+            if dirpath == root:
+                dirnames[:] = [d for d in dirnames if d not in rejected]
+            if name not in filenames:
+                continue
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            files.append(("./" + os.path.relpath(path, hostEntry["expdir"]), st.st_size,
+                          repr(st.st_mtime)))
+
+    return sorted(files)
+
+def scanLines(path, offset, size):
+    """Reads the complete lines between the offset and the size of a local
+    file through mmap, in large blocks. Returns the offset just past the
+    last complete line and a generator of the lines."""
+    if offset >= size:
+        return offset, iter([])
+
+    f = open(path, "rb")
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+    end = mm.rfind("\n", offset, min(size, len(mm))) + 1
+    if end <= offset:
+        mm.close()
+        return offset, iter([])
+
+    def scan():
+        try:
+            start = offset
+            while start < end:
+                stop = mm.rfind("\n", start, min(start + SCAN_BLOCK_SIZE, end)) + 1
+                if stop <= start:
+                    # A line longer than a block
+                    stop = mm.find("\n", start, end) + 1
+                for line in mm[start:stop].splitlines():
+                    yield line
+                start = stop
+        finally:
+            mm.close()
+
+    return end, scan()
+
+def dumpLocalFiles(hostEntry, requests, last=None):
+    """Same as tailRemoteFiles, for a host whose experiment directory is
+    mounted locally at the same path. The lines are not sampled, and only
+    the last few of each file are kept if last is given. Returns a generator
+    of lines in the format of the remote dump."""
+    for path, offset, size in requests:
+        end, lines = scanLines(os.path.join(hostEntry["expdir"], path), offset, size)
+        count = 0
+        kept = collections.deque(maxlen=last) if last else None
+        yield path
+        for line in lines:
+            count += 1
+            if kept is None:
+                yield line
+            else:
+                kept.append(line)
+        for line in kept or []:
+            yield line
+        yield "@ %d %d" % (end, count)
+
+def getSampleFilter(skip, linesRead=0):
+    """Returns the sed arguments that print every skip-th line of a file and
+    its last line, for a file whose first linesRead lines were already
+    read."""
+    return "-n '%d~%d p; $ p;'" % ((1 - linesRead) % skip, skip)
+
+def isSampledLine(lineNumber, skip):
+    return (lineNumber - 1) % skip == 0
+
+def appendSampledLines(entry, samples, position, skip):
+    """Appends the samples read by tailRemoteFiles from the tail of a file to
+    the samples of its cache entry (or None). Returns the combined samples
+    and the cache state to resume from."""
+    end, count = position
+    if entry:
+        state, extra = entry["state"], entry["state"]["extra"]
+        old = entry["data"]
+        if count and extra:
+            # The old last line was only sampled for being the last one
+            old = old[:-1]
+        samples = old + samples
+    else:
+        state = { "offset": 0, "lines": 0, "extra": False }
+        extra = False
+
+    lines = state["lines"] + count
+    if count:
+        extra = not isSampledLine(lines, skip)
+    return samples, { "offset": end, "lines": lines, "extra": extra }
+
+def tailRemoteFiles(hostEntry, requests, compress=False, **extra):
+    """Dumps the new parts of remote files through sed.
+
+    Each request is a (path, offset, size, sedArgs) tuple, asking for the
+    complete lines between the offset and the size of the file. A trailing
+    partial line is left for the next call. The output of each file starts
+    with its path and a "@ <end offset> <line count>" line, which tell where
+    to resume from."""
+    return runBashScript("""
+       %(shell)s <<'EOF'
+       cd %(expdir)s
+       # The code below is run remotely
+       c9tail() {
+           FILE=$1; OFFSET=$2; SIZE=$3; shift 3
+           chunk() { tail -c +$((OFFSET + 1)) $FILE | head -c $(($1 - OFFSET)); }
+           END=$SIZE
+           if [ "$(chunk $SIZE | tail -c 1 | wc -l)" -eq 0 ]; then
+               END=$((SIZE - $(chunk $SIZE | tail -n 1 | wc -c)))
+           fi
+           echo $FILE
+           echo "@ $END $(chunk $END | wc -l)"
+           chunk $END | sed "$@"
+           echo
+       }
+       %(calls)s
+       \nEOF""" % {
+            "shell": getTransport(hostEntry).shellCommand(wrapRemoteCommand("bash -s", compress)),
+            "expdir": hostEntry["expdir"],
+            "calls": "\n".join("c9tail %s %d %d %s" % request for request in requests)
+            }, **extra)
+
+def runAgent(hostEntry, config, compress=False, local=False, **extra):
+    """Ships the mining agent to a host and runs it with the given
+    configuration, from the experiment directory of the host. With local,
+    the agent runs on this machine whatever the transport of the host, e.g.
+    for the localhost entry."""
+    f = open(_AGENT_PATH, "r")
+    source = f.read()
+    f.close()
+
+    return runBashScript("""
+       %(shell)s <<'C9EOF'
+%(source)s
+run(%(config)r)
+C9EOF""" % {
+            "shell": (LocalTransport(hostEntry) if local else getTransport(hostEntry)).shellCommand(
+                "cd %s && %s" % (hostEntry["expdir"], wrapRemoteCommand("python -", compress))),
+            "source": source,
+            "config": config
+            }, **extra)
+
 def getCoverablePath(coverable):
     return "%s/%s.coverable" % (_COVERABLE_DIR, coverable)
 
@@ -132,7 +643,7 @@ def readHosts(hostsFile):
         tokens = line.split()
 
         host = tokens[0]
-        entry = dict(zip(["host", "cores", "root", "user", "expdir", "targetdir"], tokens))
+        entry = dict(zip(["host", "cores", "root", "user", "expdir", "targetdir", "transport"], tokens))
         entry["cores"] = int(entry["cores"])
 
         if entry["cores"] == 0:
@@ -198,7 +709,16 @@ def readKleeCmd(kleeCmd):
     return cmds
 
 def isExperimentRejected(testdir, target, workercount, tgcount):
-    return (testdir, target, workercount, tgcount) in _REJECTIONS
+    return (target, workercount, tgcount) in _getRejections().get(testdir, ())
+
+def getRejectedDirs(testdir):
+    """Returns the names of the rejected experiment directories of a test."""
+    dirs = []
+    for target, workercount, tgcount in _getRejections().get(testdir, ()):
+        dirs.append("%s-%d-%d" % (target, workercount, tgcount))
+        if tgcount == 1:
+            dirs.append("%s-%d" % (target, workercount))
+    return sorted(dirs)
 
 ################################################################################
 # Rich Terminal
@@ -34,24 +34,39 @@ import sys
 import subprocess
 import re
 import math
+import bisect
 
 from common import readHosts, runBashScript, isExperimentRejected
-from common import AverageEntry
+from common import AverageEntry, runParallel, killAfter, readLines, listRemoteFiles, runAgent
+from common import TransferMeter, getSSHCounters, tailRemoteFiles, getSampleFilter, appendSampledLines
+from common import listLocalFiles, dumpLocalFiles, getDistinctLocalHosts
+from common import DEFAULT_JOBS
+from warehouse import getFilterName
+import arrayexport
 from subprocess import PIPE
 
+# The re module supports at most 100 groups in a regex
+MAX_LAYOUT_GROUPS = 100
+
 class ToolData:
     def __init__(self):
         self.coverage = { }
         self.maxcoverage = { }
         self.mintime = { }
+        self.curves = { }
 
 
 class CoverageMiner:
-    def __init__(self, hostsName, hfilter=None, ffilter=None, targetcov=None):
+    def __init__(self, hostsName, hfilter=None, ffilter=None, targetcov=None, cache=None,
+                 agent=False, compress=False, local=False):
         self.hosts, self.localhost = readHosts(hostsName)
         self.hfilter = set(hfilter) if hfilter else None
         self.ffilter = set(ffilter) if ffilter else None
         self.targetcov = targetcov
+        self.cache = cache
+        self.agent = agent
+        self.compress = compress
+        self.local = local
 
         self.pathRe = re.compile(r"^./([^/]+)/([^/-]+)-(\d+)(-(\d+))?/worker-(\d+)/c9-coverage.txt$")
         self.covDataRe = re.compile(r"^\d+/\d+\(([0-9.]+)\)$")
@@ -59,16 +74,102 @@ class CoverageMiner:
     def _logMsg(self, msg):
         print >>sys.stderr, "-- %s" % msg
 
-    def analyzeExperiments(self, explist):
+    def analyzeExperiments(self, explist, jobs=DEFAULT_JOBS, timeout=None):
+        self.coveragedb = { }
+        self.datasets = { }
+
+        hosts = sorted(host for host in self.hosts
+                       if not self.hfilter or host in self.hfilter)
+        if self.local:
+            hosts = getDistinctLocalHosts(self.hosts, hosts)
+
+        def pollHost(host):
+            hostdb = { }
+            datasets = self._pollCoverage(host, explist, hostdb, timeout=timeout)
+            return hostdb, datasets
+
+        # Merge in host order, so the result does not depend on which
+        # host answered first
+        for host, result, error in runParallel(pollHost, hosts, jobs=jobs):
+            if error:
+                self._logMsg("NOTE: Cannot poll coverage on host '%s', error: %s" % (host, error))
+                continue
+            hostdb, self.datasets[host] = result
+            self._mergeCoverage(self.coveragedb, hostdb)
+
+        if self.cache:
+            self.cache.evict()
+
+        self._logMsg("SSH connections: %d opened, %d reused." % getSSHCounters())
+
+        self._computeExtremeValues(self.coveragedb)
+
+    def loadExperiments(self, warehouse, explist=None, since=None, until=None):
+        """Same as analyzeExperiments, with the coverage stored in a results
+        warehouse instead of the experiment files. Without a list of tests,
+        all the stored experiments are loaded."""
         self.coveragedb = { }
+        self.datasets = { }
 
-        for host in self.hosts:
+        count = 0
+        for key, host, dataset in warehouse.load("coverage", rank=self._rankResolution,
+                                                 ffilter=getFilterName(self.ffilter),
+                                                 testdirs=explist, since=since, until=until):
+            testdir, target, workercount, tgcount, _ = key
             if self.hfilter and host not in self.hfilter:
                 continue
-            self._pollCoverage(host, explist, self.coveragedb)
+            if isExperimentRejected(testdir, target, workercount, tgcount):
+                continue
+            self._addDataset(self.coveragedb, key, dataset)
+            count += 1
+        self._logMsg("Loaded %d coverage timeline(s) from %s." % (count, warehouse.path))
 
         self._computeExtremeValues(self.coveragedb)
 
+    def ingestResults(self, warehouse):
+        """Stores the coverage mined by analyzeExperiments in a results
+        warehouse, one timeline per worker."""
+        count = 0
+        for host, (resolution, datasets) in sorted(self.datasets.iteritems()):
+            records = ((host, self._getSeriesKey(path), datasets[path]) for path in sorted(datasets))
+            count += warehouse.ingest("coverage", records, ffilter=getFilterName(self.ffilter),
+                                      resolution=resolution)
+        self._logMsg("Stored %d coverage timeline(s) in %s." % (count, warehouse.path))
+
+    def _getResolution(self, skip):
+        if self.local:
+            return "full" if self.targetcov else "last"
+        elif self.agent:
+            return "curve" if self.targetcov else "max"
+        else:
+            return "every-%d" % skip if self.targetcov else "last"
+
+    def _rankResolution(self, resolution):
+        """Orders the stored resolutions, the closest to the coverage files
+        first. The coverage levels need more than the last points."""
+        if resolution in ("full", "curve"):
+            return 0
+        if resolution.startswith("every-"):
+            return int(resolution[len("every-"):])
+        return None if self.targetcov else sys.maxint
+
+    def _getSeriesKey(self, path):
+        testdir, target, workercount, _, tgcount, workerID = self.pathRe.match(path).groups()
+        return testdir, target, int(workercount), int(tgcount) if tgcount else 1, int(workerID)
+
+    def _addDataset(self, coveragedb, key, dataset):
+        testdir, target, workercount, tgcount, _ = key
+        targetData = coveragedb.setdefault(target, ToolData())
+        targetData.coverage.setdefault(workercount, {}).setdefault((testdir, tgcount), []).extend(dataset)
+
+    def _mergeCoverage(self, coveragedb, hostdb):
+        for tool, tdata in hostdb.iteritems():
+            targetData = coveragedb.setdefault(tool, ToolData())
+            for workercount, datasets in tdata.coverage.iteritems():
+                covdict = targetData.coverage.setdefault(workercount, {})
+                for tgid, dataset in datasets.iteritems():
+                    covdict.setdefault(tgid, []).extend(dataset)
+
     def _computeExtremeValues(self, coveragedb):
         for tool, tdata in coveragedb.iteritems():
             for workercount, datasets in tdata.coverage.iteritems():
@@ -78,96 +179,283 @@ class CoverageMiner:
                     maxcovdict[tgid] = maxcov
 
                     if self.targetcov:
-                        for tcov in self.targetcov:
-                            mintime = self._getCoverageTime(dataset, tcov)
-                            if mintime:
-                                mintimedict = coveragedb[tool].mintime.setdefault(workercount, {}).setdefault(tcov, {})
-                                mintimedict[tgid] = mintime
+                        curve = self._getCoverageCurve(dataset)
+                        tdata.curves.setdefault(workercount, {})[tgid] = curve
+                        self._addMinTimes(tdata.mintime, workercount, tgid, curve, self.targetcov)
 
     def _getMaxCoverage(self, dataset):
         maxentry = max(dataset, key=lambda entry: entry[1])
         return maxentry[1]
 
-    def _getCoverageTime(self, dataset, cov):
-        validset = filter(lambda entry: entry[1] >= cov, dataset)
-        if not validset:
-            return None
-        minentry = min(validset, key=lambda entry: entry[0])
-        return minentry[0]
-
-    def _pollCoverage(self, host, testdirs, coveragedb, skip=5):
+    def _getCoverageCurve(self, dataset):
+        """Returns the time-to-coverage curve of a dataset, as a list of times
+        and a list of strictly increasing coverage levels. The coverage
+        first reaches covs[i] at times[i]."""
+        times, covs = [], []
+        for timestamp, cov in sorted(dataset):
+            if not covs or cov > covs[-1]:
+                times.append(timestamp)
+                covs.append(cov)
+        return times, covs
+
+    def _getCoverageTime(self, curve, cov):
+        times, covs = curve
+        index = bisect.bisect_left(covs, cov)
+        return times[index] if index < len(covs) else None
+
+    def _addMinTimes(self, mintime, workercount, tgid, curve, thresholds):
+        for tcov in thresholds:
+            time = self._getCoverageTime(curve, tcov)
+            if time:
+                mintime.setdefault(workercount, {}).setdefault(tcov, {})[tgid] = time
+
+    def getMinTimes(self, target, thresholds):
+        """Returns the time it took to reach each coverage threshold, as a
+        {workercount: {threshold: {trial: time}}} dictionary. Thresholds
+        other than the target coverages are read off the coverage curves."""
+        mintime = { }
+        for workercount, curves in self.coveragedb[target].curves.iteritems():
+            for tgid, curve in curves.iteritems():
+                self._addMinTimes(mintime, workercount, tgid, curve, thresholds)
+        return mintime
+
+    def _pollCoverage(self, host, testdirs, coveragedb, skip=5, timeout=None):
         self._logMsg("Polling coverage for host %s..." % host)
-        proc = runBashScript("""
-           ssh %(user)s@%(host)s 'bash -s' <<EOF
-           cd %(expdir)s
-           # The code below is run remotely
-           for TESTDIR in %(testdirs)s; do            
-               find ./\\$TESTDIR -name 'c9-coverage.txt' | while read LINE; do
-                   echo \\$LINE
-                   sed %(filter)s \\$LINE
-               done
-           done
-           \nEOF""" % {
-                "user": self.hosts[host]["user"],
-                "host": host,
-                "testdirs": " ".join(testdirs),
-                "expdir": self.hosts[host]["expdir"],
-                "filter": ("-n '1~%d p; $ p;'" % skip) if self.targetcov else "'$!N;$!D;'"
-}, stdout=PIPE)
-
-        data,_ = proc.communicate()
-
-        targetData = None
-
-        for line in data.splitlines():
+        if self.local:
+            files = listLocalFiles(self.hosts[host], testdirs, "c9-coverage.txt")
+        else:
+            files = listRemoteFiles(self.hosts[host], testdirs, "c9-coverage.txt", timeout=timeout)
+        files = filter(lambda entry: self._isPathAccepted(entry[0]), files)
+
+        # The cached data depends on how the files are sampled and filtered
+        if self.local:
+            # Local files are cheap enough to read at full resolution
+            skip = 1
+            params = ("local", bool(self.targetcov),
+                      tuple(sorted(self.ffilter)) if self.ffilter else None)
+        elif self.agent:
+            params = ("agent", bool(self.targetcov),
+                      tuple(sorted(self.ffilter)) if self.ffilter else None)
+        else:
+            params = (skip if self.targetcov else None,
+                      tuple(sorted(self.ffilter)) if self.ffilter else None)
+        datasets = { }
+        requests = []
+        for path, size, mtime in files:
+            entry = self.cache.getEntry((host, path, params)) if self.cache else None
+            if entry and entry["size"] == size and entry["mtime"] == mtime:
+                datasets[path] = entry["data"]
+                continue
+            if entry and (self.agent or entry["state"] is None or entry["state"]["offset"] > size):
+                # Cannot resume, read the file again
+                entry = None
+            requests.append((path, size, mtime, entry))
+
+        if self.cache:
+            resumed = len(filter(lambda request: request[3], requests))
+            self._logMsg("Host %s: %d cached file(s), %d to resume, %d to fetch." % (
+                    host, len(files) - len(requests), resumed, len(requests) - resumed))
+
+        if requests and self.local:
+            self._readCoverage(host, requests, datasets, params)
+        elif requests:
+            self._fetchCoverage(host, requests, datasets, params, skip=skip, timeout=timeout)
+
+        for path, _, _ in files:
+            if path not in datasets:
+                continue
+            self._addDataset(coveragedb, self._getSeriesKey(path), datasets[path])
+
+        return self._getResolution(skip), datasets
+
+    def _isPathAccepted(self, path):
+        match = self.pathRe.match(path)
+        if not match:
+            return False
+        testdir, target, workercount, _, tgcount, _ = match.groups()
+        return not isExperimentRejected(testdir, target, int(workercount),
+                                        int(tgcount) if tgcount else 1)
+
+    def _fetchCoverage(self, host, requests, datasets, params, skip=5, timeout=None):
+        positions = { }
+        if self.agent:
+            proc = runAgent(self.hosts[host], {
+                    "mode": "coverage",
+                    "paths": [path for path, _, _, _ in requests],
+                    "ffilter": sorted(self.ffilter) if self.ffilter else None,
+                    "targetcov": self.targetcov
+                    }, compress=self.compress, stdout=PIPE)
+            parser = self._parseReducedCoverage
+        else:
+            proc = tailRemoteFiles(self.hosts[host], [
+                    (path, entry["state"]["offset"] if entry else 0, size,
+                     getSampleFilter(skip, entry["state"]["lines"] if entry else 0)
+                     if self.targetcov else "'$!N;$!D;'")
+                    for path, size, _, entry in requests], compress=self.compress, stdout=PIPE)
+            parser = lambda host, lines: self._parseCoverage(host, lines, positions)
+
+        timer = killAfter(proc, timeout)
+        meter = TransferMeter()
+        fetched = { }
+        for path, point in parser(host, readLines(proc.stdout, compressed=self.compress, meter=meter)):
+            fetched.setdefault(path, []).append(point)
+        proc.wait()
+        timer.cancel()
+        self._logMsg("Host %s: received %s." % (host, meter))
+
+        # Only complete transfers are worth keeping
+        complete = False
+        if proc.timedout:
+            self._logMsg("NOTE: Polling timed out on host '%s', using partial results." % host)
+        elif proc.returncode != 0:
+            self._logMsg("NOTE: Polling failed on host '%s' (exit code %d), using partial results." % (
+                    host, proc.returncode))
+        else:
+            complete = True
+
+        self._storeCoverage(host, requests, datasets, params, fetched, positions, complete, skip)
+
+    def _readCoverage(self, host, requests, datasets, params):
+        """Same as _fetchCoverage, for a host whose experiment directory is
+        mounted locally. The files are read at full resolution."""
+        positions = { }
+        fetched = { }
+        lines = dumpLocalFiles(self.hosts[host], [
+                (path, entry["state"]["offset"] if entry else 0, size)
+                for path, size, _, entry in requests], last=None if self.targetcov else 2)
+        for path, point in self._parseCoverage(host, lines, positions):
+            fetched.setdefault(path, []).append(point)
+
+        self._storeCoverage(host, requests, datasets, params, fetched, positions, True, 1)
+
+    def _storeCoverage(self, host, requests, datasets, params, fetched, positions, complete, skip):
+        """Combines the fetched points with the cached ones, and caches the
+        result of complete transfers."""
+        for path, size, mtime, entry in requests:
+            if self.agent and (path in fetched or complete):
+                data, state = fetched.get(path, []), None
+            elif path in positions and self.targetcov:
+                data, state = appendSampledLines(entry, fetched.get(path, []), positions[path], skip)
+            elif path in positions:
+                # Only the last two lines are dumped
+                data, state = appendSampledLines(entry, fetched.get(path, []), positions[path], 1)
+                data = data[-2:]
+            else:
+                # The transfer stopped before this file
+                if entry:
+                    datasets[path] = entry["data"]
+                continue
+
+            datasets[path] = data
+            if complete and self.cache:
+                self.cache.put((host, path, params), size, mtime, data, state)
+
+    def _parseReducedCoverage(self, host, lines):
+        """Same as _parseCoverage, for the "timestamp coverage" points sent
+        back by the mining agent."""
+        path = None
+
+        for line in lines:
+            line = line.strip()
+            if not len(line):
+                continue
+            if self.pathRe.match(line):
+                path = line
+                continue
+            if not path:
+                continue
+
+            timestamp, cov = line.split()
+            yield path, (float(timestamp), float(cov))
+
+    def _parseCoverage(self, host, lines, positions=None):
+        """Turns the output of the remote coverage dump into a stream of
+        (path, (timestamp, coverage)) records. The resume positions of the
+        files are stored in positions."""
+        path = None
+        layout = None
+
+        for line in lines:
             line = line.strip()
             if not len(line):
                 continue
+            if line.startswith("@"):
+                if path and positions is not None:
+                    positions[path] = tuple(int(x) for x in line.split()[1:])
+                continue
             match = self.pathRe.match(line)
             if match:
+                path = line
                 testdir, target, workercount, _, tgcount, workerID = match.groups()
                 workercount = int(workercount)
-                tgcount = int(tgcount) if tgcount else 1
                 workerID = int(workerID)
-
-                if isExperimentRejected(testdir, target, workercount, tgcount):
-                    targetData = None
-                    continue
-
-                targetData = coveragedb.setdefault(target, ToolData())
+                layout = None
                 continue
 
-            if not targetData:
+            if not path:
                 continue
 
             try:
-                tokens = line.split()
-                timestamp = float(tokens[0])
-                globcov = None
-                total = 0
-                covered = 0
-                for t in tokens[1:]:
-                    (k, v) = t.split("=")
-                    (newcovAdd, totalAdd) = (int(x) for x in v.split("(")[0].split("/")[:2]) # 26/30(86.67)
-                    if self.ffilter:
-                        if k in self.ffilter:
-                            total += totalAdd
-                            covered += newcovAdd
-                    elif k == "<global>":
-                        total = totalAdd
-                        covered = newcovAdd
-                        break
+                match = layout.match(line) if layout else None
+                if match:
+                    # Only the columns of the filtered functions are captured
+                    values = match.groups()
+                    timestamp = float(values[0])
+                    covered = sum(int(x) for x in values[1::2])
+                    total = sum(int(x) for x in values[2::2])
+                else:
+                    if self.ffilter and layout is not False:
+                        layout = self._compileLayout(line)
+                    timestamp, covered, total = self._parseCoverageLine(line)
 
                 globcov = 0 if total == 0 else 100. * covered / total
-                newcov = globcov
-                covdict = targetData.coverage.setdefault(workercount, {})
-                dataset = covdict.setdefault((testdir,tgcount), [])
-                dataset.append((timestamp, newcov))
+                yield path, (timestamp, globcov)
             except:
                 e_desc = traceback.format_exc()
                 self._logMsg("NOTE: Cannot process covdata '%s' on host '%s', target '%s'(%d), id %d, error: %s" % \
                     (line, host, target, workercount, workerID, e_desc))
 
+    def _parseCoverageLine(self, line):
+        tokens = line.split()
+        timestamp = float(tokens[0])
+        total = 0
+        covered = 0
+        for t in tokens[1:]:
+            (k, v) = t.split("=")
+            (newcovAdd, totalAdd) = (int(x) for x in v.split("(")[0].split("/")[:2]) # 26/30(86.67)
+            if self.ffilter:
+                if k in self.ffilter:
+                    total += totalAdd
+                    covered += newcovAdd
+            elif k == "<global>":
+                total = totalAdd
+                covered = newcovAdd
+                break
+
+        return timestamp, covered, total
+
+    def _compileLayout(self, line):
+        """Learns the function columns of a coverage line. Returns a regex
+        matching the lines with the same columns, which captures the
+        timestamp and the covered/total counts of the filtered functions.
+        The counts of the other functions are not looked at. Returns False
+        if the regex would need more groups than the re module supports,
+        and the lines of the file are then parsed token by token."""
+        pattern = [r"(\S+)"]
+        groups = 1
+        for t in line.split()[1:]:
+            k, sep, _ = t.partition("=")
+            if not sep:
+                return None
+            if k in self.ffilter:
+                groups += 2
+                if groups > MAX_LAYOUT_GROUPS:
+                    return False
+                pattern.append(r"\s+%s=([-+]?\d+)/([-+]?\d+)(?:[/(][^\s=]*)?" % re.escape(k))
+            else:
+                pattern.append(r"\s+%s=\S+" % re.escape(k))
+        return re.compile("".join(pattern) + "$")
+
     def _extractKeys(self, coveragedb):
         workerSet = set()
         for name, data in coveragedb.iteritems():
@@ -234,19 +522,44 @@ class CoverageMiner:
         elif format == "internal":
             self._printCoverageStatsInternal(self.coveragedb)
 
-    def printMinTimes(self, target):
+    def exportCoverage(self, outdir):
+        """Writes the coverage of each trial as arrays under outdir: the
+        time-sorted points of all its workers, their maximum and, with
+        target coverages, the time-to-coverage curve."""
+        for target, tdata in self.coveragedb.iteritems():
+            for workercount, datasets in tdata.coverage.iteritems():
+                for tgid, dataset in datasets.iteritems():
+                    points = sorted(dataset)
+                    arrays = {
+                        "coverage-times": [float(entry[0]) for entry in points],
+                        "coverage": [float(entry[1]) for entry in points],
+                        "maxcoverage": [float(tdata.maxcoverage[workercount][tgid])]
+                        }
+                    curve = tdata.curves.get(workercount, {}).get(tgid)
+                    if curve:
+                        arrays["curve-times"] = [float(x) for x in curve[0]]
+                        arrays["curve-coverage"] = [float(x) for x in curve[1]]
+                    arrayexport.saveArrays(arrayexport.getExportDir(outdir, target, workercount, tgid),
+                                           arrays)
+
+    def printMinTimes(self, target, step=None):
         if not self.coveragedb:
             self._logMsg("No coverage information.")
 
-        for workercount in sorted(self.coveragedb[target].mintime.keys()):
+        thresholds = set(self.targetcov)
+        if step:
+            thresholds.update(step * i for i in range(1, int(100 / step) + 1))
+        mintime = self.getMinTimes(target, thresholds) if step else self.coveragedb[target].mintime
+
+        for workercount in sorted(mintime.keys()):
             print "%d: " % workercount,
-            for tcov in sorted(self.targetcov):
-                values = self.coveragedb[target].mintime[workercount].get(tcov)
+            for tcov in sorted(thresholds):
+                values = mintime[workercount].get(tcov)
                 average = AverageEntry()
                 if values:
                     average.entries = list(values.values())
                     average.computeAverage(fixoutliers=True)
-                print "%d=%s" % (
+                print "%g=%s" % (
                     tcov,
                     "%d,%d,%d" % (
                             int(average.average),
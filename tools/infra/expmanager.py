@@ -39,27 +39,76 @@ import os.path
 import time
 import re
 import signal
+import errno
+import heapq
 
 from common import readHosts, readCmdlines, readExp, readKleeCmd, getCoverablePath, runBashScript
+from common import getTransport, getSSHCounters, runParallel, SSH_SESSIONS_PER_MASTER, DEFAULT_JOBS
 from common import bold, faint
-from datetime import datetime, timedelta
+from hostsession import HostSession
+from progressmonitor import ProgressMonitor, DEFAULT_REFRESH
+from supervisor import ProcessSupervisor
+from datetime import datetime
 
 from subprocess import PIPE
 
 DEFAULT_BASE_PORT = 10337
 DEFAULT_EXP_DURATION = 3600
 DEFAULT_INTER_SLEEP = 5
-MONITOR_INCREMENT = 3
+SSH_OPTIONS = "-o StrictHostKeyChecking=no"
 
 WORKER_PATH = "Release+Asserts/bin/c9-worker"
 LB_PATH = "Release+Asserts/bin/c9-lb"
 KLEE_PATH = "Release+Asserts/bin/klee"
 
+class QueuedExperiment:
+    def __init__(self, expid, target, workercount, allocs, tgcounter):
+        self.expid = expid
+        self.target = target
+        self.workercount = workercount
+        self.allocs = allocs
+        self.tgcounter = tgcounter
+        self.key = (target, workercount, tgcounter)
+        self.cores = { }
+        for host, count in allocs:
+            self.cores[host] = self.cores.get(host, 0) + count
+        self.processes = { }
+        self.batches = { }
+        self.deadline = None
+        self.kills = 0
+
+
+class SessionPool:
+    """Hands out the indices of the ssh sessions opened to each host, and
+    takes back the indices of an experiment once it finished. The lowest
+    free index is reused first, so that at most SSH_SESSIONS_PER_MASTER
+    sessions in use share the master connection of a slot."""
+    def __init__(self, hosts):
+        self.free = dict((host, []) for host in hosts)
+        self.count = dict((host, 0) for host in hosts)
+        self.owned = { }
+
+    def allocate(self, host, owner):
+        if self.free[host]:
+            index = heapq.heappop(self.free[host])
+        else:
+            index = self.count[host]
+            self.count[host] += 1
+        self.owned.setdefault(owner, []).append((host, index))
+        return index
+
+    def release(self, owner):
+        for host, index in self.owned.pop(owner, []):
+            heapq.heappush(self.free[host], index)
+
+
 class ExperimentManager:
     def __init__(self, hostsName, cmdlinesName, expName, kleeCmdName, coverableName,
                  uid=None, uidprefix="test", debugcomm=False, duration=DEFAULT_EXP_DURATION,
-                 balancetout=None, strategy=None, subprocKill=True, basePort=DEFAULT_BASE_PORT):
+                 balancetout=None, strategy=None, subprocKill=True, basePort=DEFAULT_BASE_PORT,
+                 monitorRate=None, batchLaunch=False, workQueue=False, plateau=None):
         self.hosts, self.localhost = readHosts(hostsName)
+        self.transports = dict((host, getTransport(entry)) for host, entry in self.hosts.iteritems())
         self.cmdlines = readCmdlines(cmdlinesName)
         self.exp = readExp(expName)
         self.kleeCmd = readKleeCmd(kleeCmdName)
@@ -72,17 +121,55 @@ class ExperimentManager:
         self.strategy = strategy
         self.subprocKill = subprocKill
         self.basePort = basePort
+        self.monitorRate = monitorRate
+        self.batchLaunch = batchLaunch
+        self.workQueue = workQueue
+        # A (minimum coverage gain in percentage points, window in seconds)
+        # pair, under which experiments are stopped early
+        self.plateau = plateau
+        self.exitcodes = { }
 
         self._logMsg("Using experiment name: %s" % bold(self.uid))
         self._logMsg("Using as localhost: %s" % self.localhost["host"])
 
-    def initHosts(self):
+    def initHosts(self, jobs=DEFAULT_JOBS):
+        """Prepares the local host, then the cluster hosts, jobs at a time.
+        The hosts that fail are reported together, before aborting."""
         self._prepareLocalHost()
 
-        for host in self.hosts.iterkeys():
-            self._logMsg("Initializing host '%s'..." % host)
-            if self.hosts[host]["cores"] == 0: continue
-            self._prepareRemoteHost(host)
+        hosts = sorted(host for host in self.hosts if self.hosts[host]["cores"] > 0)
+        self._logMsg("Initializing %d host(s), %d at a time..." % (len(hosts), jobs))
+
+        def prepareHost(host):
+            start = time.time()
+            error = self._prepareRemoteHost(host)
+            duration = time.time() - start
+            if error:
+                self._logMsg("Unable to initialize host '%s' (%.1f s)." % (host, duration))
+            else:
+                self._logMsg("Initialization complete for host '%s' (%.1f s)." % (host, duration))
+            return duration, error
+
+        start = time.time()
+        durations = { }
+        failures = []
+        for host, result, error in runParallel(prepareHost, hosts, jobs=jobs):
+            if not error:
+                durations[host], error = result
+            if error:
+                failures.append((host, error))
+
+        slowest = sorted(durations, key=lambda host: durations[host], reverse=True)[:3]
+        self._logMsg("Host initialization took %.1f s. Slowest: %s." % (
+                time.time() - start,
+                ", ".join("%s (%.1f s)" % (host, durations[host]) for host in slowest) or "-"))
+
+        if failures:
+            self._logMsg("Unable to initialize %d host(s):" % len(failures))
+            for host, error in failures:
+                self._logMsg("  %s: %s" % (host, error.strip()))
+            self._logMsg("Aborting...")
+            exit(1)
 
     def runExperiment(self):
         # First, make sure all the hosts are configured
@@ -90,71 +177,288 @@ class ExperimentManager:
 
         self.starttime = datetime.now()
 
+        # Numbering the experiments of each target in the order of the
+        # schedule, whatever order they run in
         tgcounters = { }
-
-        # Initializing port mappings
-        ports = dict((host, self.basePort) for host in self.hosts)
-        ports[self.localhost["host"]] = self.basePort
-        
-        for stageIndex, stage in enumerate(self.exp):
-            self._logMsg("Running stage %d of the experiment." % (stageIndex + 1))
-            time.sleep(DEFAULT_INTER_SLEEP)
-
-            processes = {}
-
+        schedule = []
+        for stage in self.exp:
+            items = []
             for item in stage:
                 target, workercount, allocs = item[0], item[1], item[2]
                 tgcounters[(target, workercount)] = tgcounters.get((target, workercount), 0) + 1
-                tgcounter = tgcounters[(target, workercount)]
-
-                # Allocate the load balancer
-                lbPort = ports[self.localhost["host"]]; ports[self.localhost["host"]] += 1
-                lbProc = self._runLB(port=lbPort, 
-                                     target=target, 
-                                     workerCount=workercount,
-                                     targetcounter=tgcounter)
-                
-                processes[(target, workercount, -1, tgcounter)] = lbProc
+                items.append((target, workercount, allocs, tgcounters[(target, workercount)]))
+            schedule.append(items)
 
-                workerID = 1
+        # Initializing port mappings, shared by the hosts simulated on the
+        # same machine
+        lbAddress = getTransport(self.localhost).address
+        ports = dict((self.transports[host].address, self.basePort) for host in self.hosts)
+        ports[lbAddress] = self.basePort
 
-                for alloc in allocs:
-                    host, alloccount = alloc[0], alloc[1]
-                    for i in range(alloccount):
-                        workerProc = self._runWorker(host=host, port=ports[host], 
-                                                     lbHost=self.localhost["host"], lbPort=lbPort, 
-                                                     target=target, workerID=workerID,
-                                                     workerCount=workercount,
-                                                     targetcounter=tgcounter)
-                        processes[(target, workercount, workerID, tgcounter)] = workerProc
-
-                        workerID += 1
-                        ports[host] += 1
-
-            # Waiting for everything to finish...
-            self._monitorProcs(processes, self.duration, showID=True)
-            if not len(processes):
+        if self.workQueue:
+            self._runQueue([item for items in schedule for item in items], ports, lbAddress)
+        else:
+            for stageIndex, items in enumerate(schedule):
+                self._runStage(stageIndex, items, ports, lbAddress)
+
+        failed = len(filter(lambda code: code != 0, self.exitcodes.itervalues()))
+        if failed:
+            self._logMsg("%d process(es) exited with a non-zero code." % failed)
+        self._logMsg("SSH connections: %d opened, %d reused." % getSSHCounters())
+
+    def _runStage(self, stageIndex, items, ports, lbAddress):
+        self._logMsg("Running stage %d of the experiment." % (stageIndex + 1))
+        time.sleep(DEFAULT_INTER_SLEEP)
+
+        processes = {}
+        sessions = SessionPool(self.hosts)
+        batches = { }
+        monitor = self._createMonitor()
+
+        for target, workercount, allocs, tgcounter in items:
+            processes.update(self._launchExperiment(target, workercount, allocs, tgcounter,
+                                                    ports, lbAddress, sessions, batches, monitor))
+
+        supervisor = ProcessSupervisor()
+        self._startBatches(batches, supervisor)
+
+        # Waiting for everything to finish...
+        supervisor.start()
+        try:
+            self._superviseProcesses(processes, supervisor)
+            self._superviseStage(processes, supervisor, monitor)
+        finally:
+            supervisor.stop()
+        for session in batches.itervalues():
+            session.join()
+        if monitor:
+            monitor.join()
+        self.exitcodes.update(supervisor.exitcodes)
+
+    def _createMonitor(self):
+        if self.monitorRate:
+            return ProgressMonitor(self.hosts, refresh=self.monitorRate, log=self._logMsg,
+                                   sshOptions=SSH_OPTIONS)
+        if self.plateau:
+            # Only follow the coverage, often enough to notice the plateaus in time
+            return ProgressMonitor(self.hosts, refresh=min(DEFAULT_REFRESH, self.plateau[1] / 4.),
+                                   log=self._logMsg, sshOptions=SSH_OPTIONS, report=False)
+        return None
+
+    def _hasPlateaued(self, expid, monitor):
+        """Tells whether the coverage of an experiment grew by less than
+        the plateau gain over the plateau window."""
+        gain, window = self.plateau
+        coverageGain = monitor.getCoverageGain(expid, window)
+        if coverageGain is None or coverageGain >= gain:
+            return False
+        self._logMsg("The coverage of %s grew by %.2f%% over the last %d s. Stopping it early." % (
+                expid, coverageGain, window))
+        return True
+
+    def _stopPlateaus(self, processes, monitor, stopped):
+        """Interrupts the processes of the experiments whose coverage
+        reached a plateau, and adds them to the stopped set."""
+        experiments = { }
+        for key, proc in processes.iteritems():
+            expid = self._getExperimentID(key[0], key[1], key[3])
+            experiments.setdefault(expid, { })[key] = proc
+
+        for expid in sorted(experiments):
+            if expid not in stopped and self._hasPlateaued(expid, monitor):
+                stopped.add(expid)
+                self._killAllProcesses(experiments[expid], "SIGINT")
+
+    def _runQueue(self, items, ports, lbAddress):
+        """Runs the experiments of the schedule as a queue, regardless of
+        the stages. An experiment starts as soon as the hosts of its
+        allocation have enough free cores for its workers, and releases
+        them once all its processes exited."""
+        queue = [QueuedExperiment(self._getExperimentID(target, workercount, tgcounter),
+                                  target, workercount, allocs, tgcounter)
+                 for target, workercount, allocs, tgcounter in items]
+        running = { }
+        freeCores = dict((host, self.hosts[host]["cores"]) for host in self.hosts)
+        sessions = SessionPool(self.hosts)
+        monitor = self._createMonitor()
+
+        self._logMsg("Running the %d experiment(s) of the schedule as a queue." % len(queue))
+
+        supervisor = ProcessSupervisor()
+        supervisor.start()
+        try:
+            while queue or running:
+                for exp in list(queue):
+                    if any(freeCores[host] < count for host, count in exp.cores.iteritems()):
+                        continue
+                    queue.remove(exp)
+                    for host, count in exp.cores.iteritems():
+                        freeCores[host] -= count
+                    self._startQueued(exp, ports, lbAddress, sessions, supervisor, monitor)
+                    running[exp.key] = exp
+                    self._logMsg("Started experiment %s (%d running, %d queued)." % (
+                            exp.expid, len(running), len(queue)))
+
+                self._waitQueued(running, supervisor, monitor)
+
+                for key, exp in running.items():
+                    if exp.processes:
+                        continue
+                    del running[key]
+                    for host, count in exp.cores.iteritems():
+                        freeCores[host] += count
+                    sessions.release(exp.expid)
+                    for session in exp.batches.itervalues():
+                        session.join()
+                    if monitor:
+                        monitor.removeExperiment(exp.expid)
+                    self._logMsg("Experiment %s finished (%d running, %d queued)." % (
+                            exp.expid, len(running), len(queue)))
+        finally:
+            supervisor.stop()
+        if monitor:
+            monitor.join()
+        self.exitcodes.update(supervisor.exitcodes)
+
+    def _startQueued(self, exp, ports, lbAddress, sessions, supervisor, monitor=None):
+        exp.processes = self._launchExperiment(exp.target, exp.workercount, exp.allocs,
+                                               exp.tgcounter, ports, lbAddress, sessions,
+                                               exp.batches, monitor)
+        self._startBatches(exp.batches, supervisor)
+        self._superviseProcesses(exp.processes, supervisor)
+        exp.deadline = time.time() + self.duration
+
+    def _waitQueued(self, running, supervisor, monitor=None):
+        """Waits for the next exit or deadline among the running experiments,
+        and signals the experiments whose deadline passed: SIGINT when
+        their duration expires, or earlier when their coverage reached a
+        plateau, then again every 40 s, starting 200 s later. As in the
+        stages, the later signals are SIGKILL unless only the subprocesses
+        are killed, but they only reach the processes of the experiment."""
+        timeout = min(exp.deadline for exp in running.itervalues()) - time.time()
+        if monitor:
+            timeout = min(timeout, monitor.refresh)
+
+        for key, exitcode in supervisor.wait(timeout):
+            exp = running.get((key[0], key[1], key[3]))
+            if exp is None or key not in exp.processes:
+                continue
+            del exp.processes[key]
+            self._logExit(key, exitcode, showID=True)
+
+        if monitor and running:
+            monitor.poll()
+
+        now = time.time()
+        if self.plateau:
+            for exp in running.itervalues():
+                if exp.processes and exp.kills == 0 and self._hasPlateaued(exp.expid, monitor):
+                    exp.deadline = now
+
+        for exp in running.itervalues():
+            if not exp.processes or now < exp.deadline:
                 continue
-            
+            if exp.kills == 0:
+                self._logMsg("Stopping experiment %s." % exp.expid)
+                self._killAllProcesses(exp.processes, "SIGINT")
+                exp.deadline = now + 200
+            else:
+                self._killAllProcesses(exp.processes, "SIGINT" if self.subprocKill else "SIGKILL")
+                exp.deadline = now + 40
+            exp.kills += 1
+
+    def _launchExperiment(self, target, workercount, allocs, tgcounter, ports, lbAddress,
+                          sessions, batches, monitor=None):
+        """Starts the load balancer and the workers of an experiment, and
+        returns its processes. With batch launching, the workers are only
+        added to the HostSession of their host in batches, which the caller
+        starts. The ssh sessions are taken from the SessionPool under the
+        ID of the experiment."""
+        processes = { }
+        expid = self._getExperimentID(target, workercount, tgcounter)
+
+        # Allocate the load balancer
+        lbPort = ports[lbAddress]; ports[lbAddress] += 1
+        lbProc = self._runLB(port=lbPort, 
+                             target=target, 
+                             workerCount=workercount,
+                             targetcounter=tgcounter)
+
+        processes[(target, workercount, -1, tgcounter)] = lbProc
+
+        workerID = 1
+
+        for alloc in allocs:
+            host, alloccount = alloc[0], alloc[1]
+            address = self.transports[host].address
+            for i in range(alloccount):
+                if self.batchLaunch:
+                    # All the workers of the host share one session
+                    if host not in batches:
+                        sshSlot = sessions.allocate(host, expid) // SSH_SESSIONS_PER_MASTER
+                        batches[host] = HostSession(self.transports[host], slot=sshSlot,
+                                                    sshOptions=SSH_OPTIONS)
+                    sshSlot = batches[host].slot
+                    workerProc = self._addBatchedWorker(batches[host], host=host,
+                                                        port=ports[address],
+                                                        lbHost=self.localhost["host"],
+                                                        lbPort=lbPort, target=target,
+                                                        workerID=workerID,
+                                                        workerCount=workercount,
+                                                        targetcounter=tgcounter)
+                else:
+                    sshSlot = sessions.allocate(host, expid) // SSH_SESSIONS_PER_MASTER
+                    workerProc = self._runWorker(host=host, port=ports[address], 
+                                                 lbHost=self.localhost["host"], lbPort=lbPort, 
+                                                 target=target, workerID=workerID,
+                                                 workerCount=workercount,
+                                                 targetcounter=tgcounter,
+                                                 sshSlot=sshSlot)
+                processes[(target, workercount, workerID, tgcounter)] = workerProc
+                if monitor:
+                    monitor.addWorker(expid, host, workerID, sshSlot=sshSlot)
+
+                workerID += 1
+                ports[address] += 1
+
+        return processes
+
+    def _startBatches(self, batches, supervisor):
+        for host in sorted(batches):
+            batches[host].start(supervisor)
+            self._logMsg("Launched %d worker(s) on %s through a single session." % (
+                    len(batches[host].workers), host))
+
+    def _superviseProcesses(self, processes, supervisor):
+        # The exits of the batched workers are reported by their session
+        for key, proc in processes.iteritems():
+            if key[2] < 0 or not self.batchLaunch:
+                supervisor.add(key, proc)
+
+    def _superviseStage(self, processes, supervisor, monitor=None):
+        self._monitorProcs(processes, supervisor, self.duration, showID=True, monitor=monitor)
+        if not len(processes):
+            return
+
+        if self.subprocKill:
+            self._killAllProcesses(processes, "SIGINT")
+        else:
+            self._killAll("SIGINT")
+
+        self._monitorProcs(processes, supervisor, 200)
+        if len(processes) == 0:
+            return
+
+        while True:
+            # Here we risk going into an infinite loop, but it's better than aborting
             if self.subprocKill:
                 self._killAllProcesses(processes, "SIGINT")
             else:
-                self._killAll("SIGINT")
-
-            self._monitorProcs(processes, 200)
+                self._killAll("SIGKILL", aggressive=True)
+            self._monitorProcs(processes, supervisor, 40)
             if len(processes) == 0:
-                continue
+                break
 
-            while True:
-                # Here we risk going into an infinite loop, but it's better than aborting
-                if self.subprocKill:
-                    self._killAllProcesses(processes, "SIGINT")
-                else:
-                    self._killAll("SIGKILL", aggressive=True)
-                self._monitorProcs(processes, 40)
-                if len(processes) == 0:
-                    break
-                
     def _killAll(self, signal, aggressive=False):
         self._logMsg("Sending the %s signal..." % signal)
         for host in self.hosts:
@@ -165,42 +469,62 @@ class ExperimentManager:
         self._killAllLocal(signal=signal)
 
     def _killAllProcesses(self, processes, sig):
+        """Sends the signal to the load balancers and the workers among the
+        processes. The workers run behind a local shell, which would not
+        pass the signal on, so they are signaled on their hosts."""
         self._logMsg("Sending the %s signal to the active processes..." % sig)
-        for proc in processes.itervalues():
-            proc.send_signal(getattr(signal, sig))
-
-    def _monitorProcs(self, processes, duration, sleeptime=1, showID=False):
-        targetTime = datetime.now()
-        delta = timedelta(seconds=MONITOR_INCREMENT)
-        totalPassed = 0
-
-        targetTime = targetTime + delta
-        while totalPassed < duration:
-            time.sleep(sleeptime)
-            if targetTime > datetime.now(): continue
-
-            cleanups = []
-            for (target, workercount, workerID, tgcounter), proc in processes.iteritems():
-                if proc.poll() is not None:
-                    cleanups.append((target, workercount, workerID, tgcounter))
-                    if workerID < 0:
-                        self._logMsg("The load balancer for target '%s'(%d) terminated.%s" % (
-                                target, workercount,
-                                (" ID: %s" % self._getExperimentID(target, workercount, tgcounter)) if showID else ""))
-                    else:
-                        self._logMsg("Worker %d for target '%s'(%d) terminated.%s" % (
-                                workerID, target, workercount,
-                                (" ID: %s" % self._getExperimentID(target, workercount, tgcounter) if showID else "")))
-
-            for item in cleanups: del processes[item]
-
-            if not len(processes):
+        workers = set()
+        batches = { }
+        for key, proc in processes.iteritems():
+            if hasattr(proc, "expdir"):
+                workers.add((proc.host, proc.expdir))
+            elif hasattr(proc, "session"):
+                # The batched workers of a session are signaled through one line
+                batches.setdefault(proc.session, []).append(proc.index)
+            else:
+                proc.send_signal(getattr(signal, sig))
+        for session, indices in batches.iteritems():
+            session.send_signal(getattr(signal, sig), sorted(indices))
+        runParallel(lambda (host, expdir): self._killWorkers(host, expdir, signal=sig),
+                    sorted(workers))
+
+    def _monitorProcs(self, processes, supervisor, duration, showID=False, monitor=None):
+        """Waits at most duration seconds for the processes to exit, and
+        removes the ones that did. Exits are reported as soon as the
+        supervisor sees them. Returns the time spent waiting."""
+        start = time.time()
+        deadline = start + duration
+        stopped = set()
+        while processes:
+            timeout = deadline - time.time()
+            if timeout <= 0:
                 break
-            
-            targetTime = targetTime + delta
-            totalPassed += MONITOR_INCREMENT
-
-        return totalPassed
+            if monitor:
+                timeout = min(timeout, monitor.refresh)
+
+            for key, exitcode in supervisor.wait(timeout):
+                if key not in processes:
+                    continue
+                del processes[key]
+                self._logExit(key, exitcode, showID)
+
+            if monitor and processes:
+                monitor.poll()
+                if self.plateau:
+                    self._stopPlateaus(processes, monitor, stopped)
+
+        return time.time() - start
+
+    def _logExit(self, key, exitcode, showID=False):
+        target, workercount, workerID, tgcounter = key
+        if workerID < 0:
+            self._logMsg("The load balancer for target '%s'(%d) terminated (exit code %d).%s" % (
+                    target, workercount, exitcode,
+                    (" ID: %s" % self._getExperimentID(target, workercount, tgcounter)) if showID else ""))
+        else:
+            self._logMsg("Worker %d for target '%s'(%d) terminated (exit code %d).%s" % (
+                    workerID, target, workercount, exitcode,
+                    (" ID: %s" % self._getExperimentID(target, workercount, tgcounter) if showID else "")))
 
     def _generateUID(self, uidprefix):
         today = datetime.now()
@@ -219,14 +543,22 @@ class ExperimentManager:
                     self._logMsg("Target '%s' not configured. Aborting..." % target)
                     exit(1)
                 totalcount = 0
+                hostcounts = { }
                 for alloc in allocs:
                     if alloc[0] not in self.hosts:
                         self._logMsg("Host '%s' not configured. Aborting..." % alloc[0])
                         exit(1)
                     totalcount += alloc[1]
+                    hostcounts[alloc[0]] = hostcounts.get(alloc[0], 0) + alloc[1]
                 if totalcount != workercount and not (totalcount == 0 and workercount == 1):
                     self._logMsg("Invalid host allocation for target '%s'. Aborting..." % target)
                     exit(1)
+                # The queue only starts the experiments that fit in the cores of their hosts
+                for host, count in hostcounts.iteritems():
+                    if self.workQueue and count > self.hosts[host]["cores"]:
+                        self._logMsg("Host '%s' has less than %d cores for target '%s'. Aborting..." % (
+                                host, count, target))
+                        exit(1)
                 
         self._logMsg("Schedule verification complete.")
 
@@ -237,7 +569,7 @@ class ExperimentManager:
 
     def _killAllRemote(self, host, signal="SIGINT", aggressive=False, freq=5):
         proc = runBashScript("""
-            ssh -o StrictHostKeyChecking=no %(user)s@%(host)s 'bash -s' <<EOF
+            %(shell)s <<EOF
             # The code below is run remotely
             while true; do
               DONE="true"
@@ -248,8 +580,7 @@ class ExperimentManager:
               sleep %(freq)d
             done
             \nEOF""" % {
-                "user": self.hosts[host]["user"],
-                "host": host,
+                "shell": self.transports[host].shellCommand("bash -s", options=SSH_OPTIONS),
                 "signal": signal,
                 "worker": os.path.basename(WORKER_PATH),
                 "lb": os.path.basename(LB_PATH),
@@ -260,6 +591,26 @@ class ExperimentManager:
 
         proc.wait()
 
+    def _killWorkers(self, host, expdir, signal="SIGINT"):
+        """Signals the workers of an experiment on a host, which are the
+        ones running from its directory."""
+        proc = runBashScript("""
+            %(shell)s <<EOF
+            # The code below is run remotely
+            DIR=\\$(cd %(expdir)s 2>/dev/null && pwd -P) || exit 0
+            for PID in \\$(pgrep -x "%(worker)s|%(klee)s"); do
+              [ "\\$(readlink /proc/\\$PID/cwd)" = "\\$DIR" ] && kill -%(signal)s \\$PID
+            done
+            \nEOF""" % {
+                "shell": self.transports[host].shellCommand("bash -s", options=SSH_OPTIONS),
+                "expdir": expdir,
+                "signal": signal,
+                "worker": os.path.basename(WORKER_PATH),
+                "klee": os.path.basename(KLEE_PATH)
+                })
+
+        proc.wait()
+
     def _killAllLocal(self, signal="SIGINT"):
         proc = runBashScript("""
             killall -%(signal)s %(worker)s
@@ -274,9 +625,10 @@ class ExperimentManager:
         proc.wait()
 
     def _prepareRemoteHost(self, host, cleanCores=True):
+        """Returns None once the host is ready, or the reason it is not."""
         proc = runBashScript("""
-            ssh -o StrictHostKeyChecking=no %(user)s@%(host)s 'bash -s' <<EOF && \
-            scp %(coverage)s %(user)s@%(host)s:%(expdir)s/%(newdir)s/$(basename %(coverage)s)
+            %(shell)s <<EOF && \
+            %(copy)s
             # The code below is run remotely
             if [ ! -f %(root)s/%(worker)s ]; then echo "Cannot find the Cloud9 worker executable: %(root)s/%(worker)s";  exit 1; fi
             if [ ! -f %(root)s/%(klee)s ]; then echo "Cannot find the Klee executable: %(root)s/%(klee)s"; exit 1; fi
@@ -285,22 +637,23 @@ class ExperimentManager:
             if [ -h %(expdir)s/last ]; then rm -f %(expdir)s/last; fi
             [ ! -a %(expdir)s/last ] && ln -s %(expdir)s/%(newdir)s %(expdir)s/last
             \nEOF""" % {
-                "user": self.hosts[host]["user"],
-                "host": host,
-                "coverage": self.coverable,
+                "shell": self.transports[host].shellCommand("bash -s", options=SSH_OPTIONS),
+                "copy": self.transports[host].copyCommand(
+                    self.coverable, "%s/%s/%s" % (self.hosts[host]["expdir"], self.uid,
+                                                  os.path.basename(self.coverable)),
+                    options=SSH_OPTIONS),
                 "root": self.hosts[host]["root"],
                 "worker": WORKER_PATH,
                 "klee": KLEE_PATH,
                 "expdir": self.hosts[host]["expdir"], 
                 "newdir": self.uid,
                 "cleancores": "true" if cleanCores else "false"
-                })
+                }, stdout=PIPE, stderr=subprocess.STDOUT)
 
-        if proc.wait() != 0:
-            self._logMsg("Unable to initialize host '%s'. Aborting..." % host)
-            exit(1)
-        else:
-            self._logMsg("Initialization complete for host '%s'." % host)
+        output = proc.communicate()[0]
+        if proc.returncode != 0:
+            return output.strip() or "exit code %d" % proc.returncode
+        return None
 
     def _prepareLocalHost(self):
         proc = runBashScript("""
@@ -326,7 +679,7 @@ class ExperimentManager:
             self._getExperimentID(target, workerCount, targetcounter))
         proc = runBashScript("""
             mkdir -p %(logdir)s
-            %(root)s/%(lb)s -address %(address)s -port %(port)d %(debugcomm)s %(btout)s &>%(logfile)s""" % {
+            exec %(root)s/%(lb)s -address %(address)s -port %(port)d %(debugcomm)s %(btout)s &>%(logfile)s""" % {
                 "logdir": logdir,
                 "root": self.localhost["root"],
                 "lb": LB_PATH,
@@ -341,39 +694,28 @@ class ExperimentManager:
 
         return proc
 
-    def _runWorker(self, host, port, lbHost, lbPort, target, workerID, workerCount, targetcounter):
-        logdir = "%s/%s" % (
-            self.localhost["expdir"],
-            self._getExperimentID(target, workerCount, targetcounter))
-        if self.cmdlines[target].startswith("/"):
-            cmdline = self.cmdlines[target]
-        else:
-            cmdline = "%s/%s" % (self.hosts[host]["targetdir"], self.cmdlines[target])
-
-        proc = runBashScript("""
-            mkdir -p %(logdir)s
-            ssh -o StrictHostKeyChecking=no %(user)s@%(host)s 'bash -s' <<EOF &>%(logfile)s
-            # The code below is run remotely
-            mkdir -p %(expdir)s
-            cd %(expdir)s
-            ulimit -c unlimited
-            setarch $(arch) -R %(root)s/%(worker)s -c9-lb-host %(lbhost)s -c9-lb-port %(lbport)d \
-              -c9-local-host %(lhost)s -c9-local-port %(lport)d %(jobsel)s \
-              -output-dir %(outdir)s \
-              %(kcmd)s %(debugcomm)s %(debugcov)s \
-              --max-time %(maxtime)d --coverable-modules %(coverable)s \
-              %(cmdline)s
-            \nEOF""" % {
-                "user": self.hosts[host]["user"],
-                "host": host,
-                "expdir": "%s/%s" % (
-                    self.hosts[host]["expdir"],
-                    self._getExperimentID(target, workerCount, targetcounter)),
+    def _getWorkerCommand(self, host, port, lbHost, lbPort, target, workerID, workerCount,
+                          targetcounter):
+        """Returns the directory a worker is run from on its host, and its
+        command line."""
+        # The command lines are read with their line ends
+        cmdline = self.cmdlines[target].strip()
+        if not cmdline.startswith("/"):
+            cmdline = "%s/%s" % (self.hosts[host]["targetdir"], cmdline)
+
+        expdir = "%s/%s" % (self.hosts[host]["expdir"],
+                            self._getExperimentID(target, workerCount, targetcounter))
+        command = ("setarch $(arch) -R %(root)s/%(worker)s -c9-lb-host %(lbhost)s -c9-lb-port %(lbport)d "
+                   "-c9-local-host %(lhost)s -c9-local-port %(lport)d %(jobsel)s "
+                   "-output-dir %(outdir)s "
+                   "%(kcmd)s %(debugcomm)s %(debugcov)s "
+                   "--max-time %(maxtime)d --coverable-modules %(coverable)s "
+                   "%(cmdline)s") % {
                 "root": self.hosts[host]["root"],
                 "worker": WORKER_PATH,
                 "lbhost": lbHost,
                 "lbport": lbPort,
-                "lhost": host,
+                "lhost": self.transports[host].address,
                 "lport": port,
                 "jobsel": " ".join(["-c9-job-%s" % x for x in 
                                     (self.strategy.split(",") 
@@ -385,13 +727,59 @@ class ExperimentManager:
                 "debugcov": "--debug-coverable-instr" if self.debugcomm else "",
                 "maxtime": self.duration,
                 "coverable": "../%s" % os.path.basename(self.coverable),
-                "cmdline": cmdline,
+                "cmdline": cmdline
+                }
+        return expdir, command
+
+    def _runWorker(self, host, port, lbHost, lbPort, target, workerID, workerCount, targetcounter,
+                   sshSlot=0):
+        logdir = "%s/%s" % (
+            self.localhost["expdir"],
+            self._getExperimentID(target, workerCount, targetcounter))
+        expdir, command = self._getWorkerCommand(host, port, lbHost, lbPort, target, workerID,
+                                                 workerCount, targetcounter)
+
+        proc = runBashScript("""
+            mkdir -p %(logdir)s
+            %(shell)s <<EOF &>%(logfile)s
+            # The code below is run remotely
+            mkdir -p %(expdir)s
+            cd %(expdir)s
+            ulimit -c unlimited
+            %(command)s
+            \nEOF""" % {
+                "shell": self.transports[host].shellCommand("bash -s", slot=sshSlot, options=SSH_OPTIONS),
+                "expdir": expdir,
+                "command": command,
                 "logdir": logdir,
                 "logfile": "%s/out-worker-%d.txt" % (logdir, workerID) 
                 })
 
         self._logMsg("Worker %d created on %s, port %d (lb. port %d) for target '%s'(%d)." % (workerID, host, port, lbPort, target, workerCount))
 
+        # Where the worker is signaled from
+        proc.host = host
+        proc.expdir = expdir
+        return proc
+
+    def _addBatchedWorker(self, session, host, port, lbHost, lbPort, target, workerID, workerCount,
+                          targetcounter):
+        logdir = "%s/%s" % (
+            self.localhost["expdir"],
+            self._getExperimentID(target, workerCount, targetcounter))
+        try:
+            os.makedirs(logdir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        expdir, command = self._getWorkerCommand(host, port, lbHost, lbPort, target, workerID,
+                                                 workerCount, targetcounter)
+
+        proc = session.addWorker((target, workerCount, workerID, targetcounter), expdir, command,
+                                 "%s/out-worker-%d.txt" % (logdir, workerID))
+
+        self._logMsg("Worker %d added on %s, port %d (lb. port %d) for target '%s'(%d)." % (workerID, host, port, lbPort, target, workerCount))
+
         return proc
 
     def _logMsg(self, msg):
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+"""
+Generates a synthetic experiment tree to benchmark the miners.
+
+The tree has the layout of real experiments: the coverage and stats files
+of each worker under the experiment directory of its host, and the load
+balancer logs under the directory of the local host. A hosts file pointing
+at the tree and a bench.json manifest, read by bench-miners.py, are
+written next to it.
+"""
+
+import os
+import sys
+import json
+import random
+import getpass
+
+from argparse import ArgumentParser
+from statsminer import Stats
+
+BENCH_HOSTS = "bench"
+TARGETS = ["memcached", "printf", "ls", "grep", "sort", "tr"]
+
+_GAUGES = (Stats.CURRENT_JOB_COUNT, Stats.CURRENT_ACTIVE_STATE_COUNT, Stats.CURRENT_STATE_COUNT)
+
+def _logMsg(msg):
+    print >>sys.stderr, "-- %s" % msg
+
+def writeHosts(outdir, hostcount, cores):
+    """Writes the hosts file of the benchmark and returns the experiment
+    directories of the cluster hosts and of the local host."""
+    expdirs = dict(("bench-%d" % i, os.path.join(outdir, "data", "bench-%d" % i))
+                   for i in range(1, hostcount + 1))
+    localdir = os.path.join(outdir, "data", "localhost")
+
+    if not os.path.isdir(os.path.join(outdir, "hosts")):
+        os.makedirs(os.path.join(outdir, "hosts"))
+    f = open(os.path.join(outdir, "hosts", "%s.hosts" % BENCH_HOSTS), "w")
+    for host in sorted(expdirs):
+        print >>f, "%s %d %s %s %s -" % (host, cores, outdir, getpass.getuser(), expdirs[host])
+    print >>f, "localhost 0 %s %s %s -" % (outdir, getpass.getuser(), localdir)
+    f.close()
+
+    return expdirs, localdir
+
+def writeCoverage(path, duration, period, functions):
+    """Writes a coverage file sampled every period seconds. The covered
+    counts of the functions grow quickly at first, then level off."""
+    sizes = [random.randint(5, 200) for _ in range(functions)]
+    covered = [0] * functions
+    total = sum(sizes)
+    lines = 0
+
+    f = open(path, "w")
+    timestamp = random.uniform(0, period)
+    while timestamp < duration:
+        for i in range(functions):
+            if covered[i] < sizes[i] and random.random() < 0.3 * (1 - float(covered[i]) / sizes[i]):
+                covered[i] += 1
+        globcov = sum(covered)
+        f.write("%.3f <global>=%d/%d(%.2f) %s\n" % (
+                timestamp, globcov, total, 100. * globcov / total,
+                " ".join("f%d=%d/%d(%.2f)" % (i, covered[i], sizes[i], 100. * covered[i] / sizes[i])
+                         for i in range(functions))))
+        lines += 1
+        timestamp += period
+    f.close()
+
+    return lines
+
+def writeStats(path, duration, period):
+    """Writes a stats file sampled every period seconds, with the counters
+    of the Stats IDs. About a fifth of the instructions are replayed."""
+    ids = sorted(value for name, value in vars(Stats).iteritems() if name.isupper())
+    counters = dict((k, 0) for k in ids)
+    lines = 0
+
+    f = open(path, "w")
+    timestamp = random.uniform(0, period)
+    while timestamp < duration:
+        instructions = random.randint(500000, 2000000)
+        counters[Stats.TOTAL_PROC_INSTRUCTIONS] += instructions
+        counters[Stats.TOTAL_REPLAY_INSTRUCTIONS] += int(instructions * random.uniform(0.1, 0.3))
+        for k in ids:
+            if k in _GAUGES:
+                counters[k] = random.randint(0, 5000)
+            elif k not in (Stats.TOTAL_PROC_INSTRUCTIONS, Stats.TOTAL_REPLAY_INSTRUCTIONS):
+                counters[k] += random.randint(0, 100)
+        f.write("%.3f %s\n" % (timestamp, " ".join("%d=%d" % (k, counters[k]) for k in ids)))
+        lines += 1
+        timestamp += period
+    f.close()
+
+    return lines
+
+def writeBalancerLog(path, duration, workercount):
+    """Writes a load balancer log, with a job total every second and
+    transfer requests between random workers."""
+    total = 0
+    lines = 0
+
+    f = open(path, "w")
+    timestamp = 0.0
+    while timestamp < duration:
+        if timestamp < duration - 1:
+            total = max(1, total + random.randint(-50, 60))
+        else:
+            total = 0
+        f.write("[%.3f] [LB] Job counts: [%d] IN TOTAL\n" % (timestamp, total))
+        lines += 1
+        if workercount > 1 and random.random() < 0.4:
+            source, dest = random.sample(range(1, workercount + 1), 2)
+            f.write("[%.3f] [LB] Created transfer request from %d to %d for %d states\n" % (
+                    timestamp + 0.5, source, dest, random.randint(1, max(1, total // workercount))))
+            lines += 1
+        timestamp += 1.0
+    f.close()
+
+    return lines
+
+def generate(outdir, hostcount, cores, experiments, workercount, duration,
+             covperiod, statsperiod, functions, testdir):
+    expdirs, localdir = writeHosts(outdir, hostcount, cores)
+    hosts = sorted(expdirs)
+
+    manifest = {
+        "hosts": BENCH_HOSTS,
+        "testdir": testdir,
+        "targets": [],
+        "workers": 0,
+        "lines": {"coverage": 0, "stats": 0, "balancer": 0}
+        }
+    tgcounters = { }
+    hostIndex = 0
+    for index in range(experiments):
+        target = TARGETS[index % len(TARGETS)]
+        tgcounters[target] = tgcounters.get(target, 0) + 1
+        tgcount = tgcounters[target]
+        expname = "%s-%d%s" % (target, workercount, ("-%d" % tgcount) if tgcount > 1 else "")
+        if target not in manifest["targets"]:
+            manifest["targets"].append(target)
+        _logMsg("Generating experiment %s (%d/%d)..." % (expname, index + 1, experiments))
+
+        for workerID in range(1, workercount + 1):
+            host = hosts[hostIndex % len(hosts)]
+            hostIndex += 1
+            workerdir = os.path.join(expdirs[host], testdir, expname, "worker-%d" % workerID)
+            if not os.path.isdir(workerdir):
+                os.makedirs(workerdir)
+            manifest["lines"]["coverage"] += writeCoverage(
+                os.path.join(workerdir, "c9-coverage.txt"), duration, covperiod, functions)
+            manifest["lines"]["stats"] += writeStats(
+                os.path.join(workerdir, "c9-stats.txt"), duration, statsperiod)
+            manifest["workers"] += 1
+
+        lbdir = os.path.join(localdir, testdir, expname)
+        if not os.path.isdir(lbdir):
+            os.makedirs(lbdir)
+        manifest["lines"]["balancer"] += writeBalancerLog(
+            os.path.join(lbdir, "out-lb.txt"), duration, workercount)
+
+    f = open(os.path.join(outdir, "bench.json"), "w")
+    json.dump(manifest, f, indent=2, sort_keys=True)
+    f.close()
+
+    return manifest
+
+def main():
+    parser = ArgumentParser(description="Generate a synthetic Cloud9 experiment tree for benchmarks.")
+    parser.add_argument("outdir", help="Directory of the generated tree")
+    parser.add_argument("--hosts", type=int, default=4, help="Number of cluster machines")
+    parser.add_argument("--cores", type=int, default=8, help="Number of cores of each machine")
+    parser.add_argument("-e", "--experiments", type=int, default=4, help="Number of experiments")
+    parser.add_argument("-w", "--workers", type=int, default=16, help="Number of workers of each experiment")
+    parser.add_argument("-d", "--duration", type=int, default=3600,
+                        help="Duration of each experiment, in seconds")
+    parser.add_argument("--coverage-period", type=float, default=10,
+                        help="Seconds between two coverage samples")
+    parser.add_argument("--stats-period", type=float, default=5,
+                        help="Seconds between two stats samples")
+    parser.add_argument("--functions", type=int, default=20,
+                        help="Number of functions in the coverage files")
+    parser.add_argument("--testdir", default="bench-2000-01-01-00-00-00",
+                        help="Name of the test directory")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    outdir = os.path.abspath(args.outdir)
+    manifest = generate(outdir, args.hosts, args.cores, args.experiments, args.workers,
+                        args.duration, args.coverage_period, args.stats_period, args.functions,
+                        args.testdir)
+    _logMsg("Generated %d workers: %d coverage, %d stats and %d balancer lines." % (
+            manifest["workers"], manifest["lines"]["coverage"], manifest["lines"]["stats"],
+            manifest["lines"]["balancer"]))
+
+if __name__ == "__main__":
+    main()
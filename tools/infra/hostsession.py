@@ -0,0 +1,193 @@
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+"""
+Implements the HostSession class, which launches all the workers of a host
+through a single shell session.
+"""
+
+import threading
+
+from common import runBashScript
+from subprocess import PIPE
+
+# The exit code reported for the workers still running when their session
+# ended, e.g. because the connection to the host was lost
+SESSION_LOST_CODE = 255
+
+# Run remotely by bash, which reads it from its standard input. The whole
+# script is parsed before running c9main, so the rest of the input is left
+# to the read loop, which receives the signals to forward. The session ends
+# once all the workers are reported, since "exit" is on the same line as
+# c9main. The exits are reported by c9main, which also sees the workers
+# killed along with their c9run.
+_SUPERVISOR_SCRIPT = """
+c9run() {
+    ID=$1; DIR=$2; shift 2
+    # A handler, unlike an ignored signal, is reset in the worker
+    trap : INT TERM HUP
+    mkdir -p $DIR && cd $DIR || return 1
+    ulimit -c unlimited
+    "$@" 2>&1 | (trap '' INT TERM HUP; exec sed -u "s/^/$ID /")
+    return ${PIPESTATUS[0]}
+}
+c9kill() {
+    # Signals the workers of the given IDs, or all of them
+    SIG=$1; shift
+    for PID in ${!PIDS[@]}; do
+        [ $# -gt 0 ] && [[ " $* " != *" ${PIDS[$PID]} "* ]] && continue
+        kill -$SIG -- -$PID 2>/dev/null
+    done
+}
+c9main() {
+    # Each worker gets its own process group, which the signals are sent to
+    set -m
+    trap "c9kill HUP; exit 1" INT TERM HUP
+    # The IDs of the workers, by the PID of their c9run
+    PIDS=()
+%(workers)s
+    while [ ${#PIDS[@]} -gt 0 ]; do
+        IFS= read -r -t 1 LINE
+        case $? in
+            0) LINE="$PART$LINE"; PART=
+               [ "${LINE#KILL }" != "$LINE" ] && c9kill ${LINE#KILL } ;;
+            1) c9kill HUP; break ;;
+            # A timeout can split a line, whose start is kept for the next read
+            *) PART="$PART$LINE" ;;
+        esac
+        for PID in ${!PIDS[@]}; do
+            kill -0 $PID 2>/dev/null && continue
+            wait $PID
+            CODE=$?
+            echo "EXIT ${PIDS[$PID]} $CODE"
+            unset PIDS[$PID]
+        done
+    done
+}
+c9main; exit
+"""
+
+
+class BatchedWorker:
+    """Stands for a worker of a HostSession among the processes of an
+    experiment. Its exit is reported by the session."""
+
+    def __init__(self, session, key, index):
+        self.session = session
+        self.key = key
+        self.index = index
+
+    def send_signal(self, signum):
+        self.session.send_signal(signum, [self.index])
+
+
+class HostSession:
+    """Runs a batch of workers on a host through one shell session, instead
+    of one session per worker. A bash supervisor on the host starts the
+    workers in the background and sends back their output, each line
+    prefixed with the index of the worker, and their exits, as
+    "EXIT <index> <code>" lines. As with Popen, the exit code of a worker
+    killed by a signal is minus the signal. A reader thread writes the lines
+    to the local log files of the workers and reports the exits to a
+    ProcessSupervisor. Signals are forwarded to the workers as
+    "KILL <signal> <index>..." lines on the input of the session, or to all
+    of them when no index is given."""
+
+    def __init__(self, transport, slot=0, sshOptions=""):
+        self.transport = transport
+        self.slot = slot
+        self.sshOptions = sshOptions
+        self.workers = []
+        self.proc = None
+        self._thread = None
+
+    def addWorker(self, key, workdir, command, logfile):
+        """Adds a worker to launch, with its working directory on the host,
+        its command line and its local log file. Returns the BatchedWorker
+        standing for it. Its exit is reported under key."""
+        self.workers.append((key, workdir, command, logfile))
+        return BatchedWorker(self, key, len(self.workers) - 1)
+
+    def start(self, supervisor):
+        workers = "\n".join("    c9run %d %s %s </dev/null & PIDS[$!]=%d" % (index, workdir, command, index)
+                            for index, (_, workdir, command, _) in enumerate(self.workers))
+
+        self.proc = runBashScript(
+            self.transport.shellCommand("bash -s", slot=self.slot, options=self.sshOptions),
+            stdin=PIPE, stdout=PIPE)
+        self.proc.stdin.write(_SUPERVISOR_SCRIPT % {"workers": workers})
+        self.proc.stdin.flush()
+
+        self._thread = threading.Thread(target=self._readOutput, args=(supervisor,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def join(self):
+        """Waits for the session to end, once all its workers exited."""
+        if self._thread is not None:
+            self._thread.join()
+
+    def send_signal(self, signum, indices=None):
+        """Signals the workers of the indices, or all of them."""
+        try:
+            self.proc.stdin.write("KILL %s\n" % " ".join(map(str, [signum] + list(indices or []))))
+            self.proc.stdin.flush()
+        except (IOError, ValueError):
+            # The session already ended
+            pass
+
+    def _readOutput(self, supervisor):
+        logs = dict((index, open(logfile, "w", 1))
+                    for index, (_, _, _, logfile) in enumerate(self.workers))
+
+        for line in iter(self.proc.stdout.readline, ""):
+            tag, _, rest = line.partition(" ")
+            if tag == "EXIT":
+                index, exitcode = (int(x) for x in rest.split())
+                if exitcode > 128:
+                    # Killed by a signal
+                    exitcode = 128 - exitcode
+                if index in logs:
+                    logs.pop(index).close()
+                    supervisor.report(self.workers[index][0], exitcode)
+            elif tag.isdigit() and int(tag) in logs:
+                logs[int(tag)].write(rest)
+
+        for index, log in logs.iteritems():
+            log.close()
+            supervisor.report(self.workers[index][0], SESSION_LOST_CODE)
+
+        self.proc.stdout.close()
+        try:
+            self.proc.stdin.close()
+        except IOError:
+            pass
+        self.proc.wait()
@@ -32,6 +32,10 @@
 
 from argparse import ArgumentParser
 from coverageminer import CoverageMiner
+from common import DEFAULT_JOBS
+from minecache import MineCache, DEFAULT_CACHE_SIZE
+from warehouse import ResultsWarehouse, DEFAULT_WAREHOUSE_PATH
+import arrayexport
 
 def main():
     parser = ArgumentParser(description="Mine Cloud9 experiments.",
@@ -42,9 +46,44 @@ def main():
     parser.add_argument("-t", action="store_true", default=False, help="Display in a tabular, human-readable format")
     parser.add_argument("-m", action="append", help="Mine only the specified machines")
     parser.add_argument("-c", nargs="+", help="Measure the time it takes to get a coverage level")
+    parser.add_argument("--step", type=float,
+                        help="With -c, also measure the time it takes to get every multiple of a coverage step")
     parser.add_argument("-x", action="append", help="Mine coverage only for functions listed in the specified file")
+    parser.add_argument("-j", type=int, default=DEFAULT_JOBS, help="Number of machines to poll concurrently")
+    parser.add_argument("--timeout", type=int, help="Give up polling a machine after the specified number of seconds")
+    parser.add_argument("-a", "--agent", action="store_true", default=False,
+                        help="Reduce the coverage data on the machines, at full resolution")
+    parser.add_argument("-z", "--compress", action="store_true", default=False,
+                        help="Compress the mined data on the machines before the transfer")
+    parser.add_argument("-l", "--local", action="store_true", default=False,
+                        help="Read the coverage at full resolution from the experiment directories, "
+                        "mounted locally at the same path")
+    parser.add_argument("--no-cache", action="store_true", default=False,
+                        help="Do not use the local cache of mined files")
+    parser.add_argument("--clear-cache", action="store_true", default=False,
+                        help="Drop the cached coverage of the mined machines before mining")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        help="Maximum size of the coverage cache, in MB")
+    parser.add_argument("--export", metavar="DIR",
+                        help="Also write the coverage as NumPy arrays under the specified directory")
+    parser.add_argument("--ingest", action="store_true", default=False,
+                        help="Store the mined coverage in the results warehouse")
+    parser.add_argument("--from-warehouse", action="store_true", default=False,
+                        help="Read the coverage from the results warehouse instead of the machines")
+    parser.add_argument("--warehouse", default=DEFAULT_WAREHOUSE_PATH,
+                        help="Path of the results warehouse")
+    parser.add_argument("--since", help="With --from-warehouse, only use the experiments started "
+                        "since a date (YYYY-MM-DD) or an age (e.g. 30d)")
+    parser.add_argument("--until", help="With --from-warehouse, only use the experiments started "
+                        "before a date (YYYY-MM-DD) or an age (e.g. 30d)")
 
     args = parser.parse_args()
+    if args.local and args.agent:
+        parser.error("--local and --agent are mutually exclusive")
+    if args.ingest and args.from_warehouse:
+        parser.error("--ingest and --from-warehouse are mutually exclusive")
+    if args.export and not arrayexport.isAvailable():
+        parser.error("--export requires NumPy to be installed")
     tests = args.tests[:]
 
     if args.f:
@@ -62,14 +101,36 @@ def main():
             ffilter.extend(f.read().split())
             f.close()
 
+    cache = None
+    if not args.no_cache and not args.from_warehouse:
+        cache = MineCache("coverage", maxsize=args.cache_size)
+        if args.clear_cache:
+            cache.invalidate(hosts=set(args.m) if args.m else None)
+
     covminer = CoverageMiner(args.hosts, 
                              hfilter=args.m, 
                              ffilter=ffilter,
-                             targetcov=map(float, args.c[1:]) if args.c else None)
-    covminer.analyzeExperiments(tests)
+                             targetcov=map(float, args.c[1:]) if args.c else None,
+                             cache=cache,
+                             agent=args.agent,
+                             compress=args.compress,
+                             local=args.local)
+    if args.from_warehouse:
+        warehouse = ResultsWarehouse(args.warehouse)
+        covminer.loadExperiments(warehouse, tests, since=args.since, until=args.until)
+        warehouse.close()
+    else:
+        covminer.analyzeExperiments(tests, jobs=args.j, timeout=args.timeout)
+        if args.ingest:
+            warehouse = ResultsWarehouse(args.warehouse)
+            covminer.ingestResults(warehouse)
+            warehouse.close()
+
+    if args.export:
+        covminer.exportCoverage(args.export)
 
     if args.c:
-        covminer.printMinTimes(args.c[0])
+        covminer.printMinTimes(args.c[0], step=args.step)
     else:
         covminer.printCoverageStats("human" if args.t else "internal")
 
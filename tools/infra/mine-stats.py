@@ -1,4 +1,4 @@
-/usr/bin/env python
+#!/usr/bin/env python
 #
 # Cloud9 Parallel Symbolic Execution Engine
 # 
@@ -30,203 +30,12 @@
 # All contributors are listed in CLOUD9-AUTHORS file.
 #
 
-import sys
-import subprocess
-import re
-import math
-import itertools
-
-from common import readHosts, runBashScript, isExperimentRejected
-from common import AverageEntry
-from subprocess import PIPE
 from argparse import ArgumentParser
-
-class Stats:
-    TOTAL_PROC_INSTRUCTIONS = 0
-    TOTAL_PROC_JOBS = 1
-    TOTAL_REPLAYED_JOBS = 14
-    TOTAL_EXPORTED_JOBS = 8
-    TOTAL_IMPORTED_JOBS = 9
-    TOTAL_DROPPED_JOBS = 10
-    TOTAL_FORKED_STATES = 15
-    TOTAL_FINISHED_STATES = 16
-    TOTAL_TREE_PATHS = 17
-    TOTAL_REPLAY_INSTRUCTIONS = 20
-    CURRENT_JOB_COUNT = 11
-    CURRENT_ACTIVE_STATE_COUNT = 18
-    CURRENT_STATE_COUNT = 19
-
-class StatsEntry:
-    def __init__(self, timestamp=None, stats=None):
-        self.timestamp = timestamp
-        self.stats = stats
-
-class StatsMiner:
-    def __init__(self, hostsName, hfilter=None):
-        self.hosts, self.localhost = readHosts(hostsName)
-        self.hfilter = set(hfilter) if hfilter else None
-
-        self.pathRe = re.compile(r"^./([^/]+)/([^/-]+)-(\d+)(-(\d+))?/worker-(\d+)/c9-stats.txt$")
-
-    def _logMsg(self, msg):
-        print >>sys.stderr, "-- %s" % msg
-
-    def analyzeExperiments(self, explist, wcfilter=None, samplerate=None):
-        statsdb = { }
-
-        for host in self.hosts:
-            if self.hfilter and host not in self.hfilter:
-                continue
-            self._pollStats(host, explist, statsdb, wcfilter=wcfilter)
-
-        aggdb = self._aggregateStats(statsdb, samplerate=samplerate)
-        avgdb = self._averageUsefulWork(aggdb)
-        
-        return avgdb
-
-    def _pollStats(self, host, testdirs, statsdb, skip=5, wcfilter=None):
-        self._logMsg("Polling stats for host %s..." % host)
-        proc = runBashScript("""
-           ssh %(user)s@%(host)s 'bash -s' <<EOF
-           cd %(expdir)s
-           # The code below is run remotely
-           for TESTDIR in %(testdirs)s; do            
-               find ./\\$TESTDIR -name 'c9-stats.txt' | while read LINE; do
-                   echo \\$LINE
-                   sed -n '1~%(skip)d p; $ p;' \\$LINE
-                   echo
-               done
-           done
-           \nEOF""" % {
-                "user": self.hosts[host]["user"],
-                "host": host,
-                "testdirs": " ".join(testdirs),
-                "expdir": self.hosts[host]["expdir"],
-                "skip": skip
-                }, stdout=PIPE)
-
-        data,_ = proc.communicate()
-        entries = None
-
-        for line in data.splitlines():
-            line = line.strip()
-            if not len(line):
-                continue
-
-            match = self.pathRe.match(line)
-            if match:
-                testdir, target, workercount, _, tgcount, workerID = match.groups()
-                workercount = int(workercount)
-                tgcount = int(tgcount) if tgcount else 1
-                workerID = int(workerID)
-
-                if wcfilter and workercount != wcfilter:
-                    entries = None
-                    continue
-                if isExperimentRejected(testdir, target, workercount, tgcount):
-                    entries = None
-                    continue
-
-                tgdata = statsdb.setdefault(target, {})
-                expdata = tgdata.setdefault((testdir, tgcount), {})
-                wrkdata = expdata.setdefault(workercount, {})
-                entries = wrkdata.setdefault(workerID, [])
-                continue
-
-            if entries is None:
-                continue
-
-            tokpair = line.split(" ", 1)
-            timestamp = float(tokpair[0])
-            if len(tokpair) > 1:
-                stats = dict([(int(x[0]),int(x[1])) 
-                              for x in map(lambda token: token.split("="), tokpair[1].split())])
-            else:
-                stats = {}
-
-            entry = StatsEntry(timestamp, stats)
-            entries.append(entry)
-
-        return
-
-    def _aggregateStats(self, statsdb, samplerate=None):
-        def aggEntries(entries):
-            result = { }
-            for entry in entries:
-                for k,v in entry.stats.iteritems():
-                    result[k] = result.get(k, 0) + v
-            return result
-
-        if not samplerate:
-            samplerate = 60
-
-        aggdb = { }
-        for target, exps in statsdb.iteritems():
-            tgdata = aggdb.setdefault(target, {})
-            for tgtrial, exp in exps.iteritems():
-                expdata = tgdata.setdefault(tgtrial, {})
-                for workercount, entries in exp.iteritems():
-                    wrkdata = expdata.setdefault(workercount, [])
-                    iterators = dict([(k, iter(v)) for k,v in entries.iteritems()])
-                    curvalues = dict([(k, iterators[k].next()) for k in iterators.iterkeys()])
-                    aggvalues = dict(curvalues)
-
-                    pointiter = (samplerate*i for i in itertools.count())
-                    targetpoint = pointiter.next()
-                    entry = None
-                    while len(iterators):
-                        k, entry = min(curvalues.iteritems(), key=lambda pair: pair[1].timestamp)
-
-                        if targetpoint is not None and entry.timestamp > targetpoint:
-                            aggregation = aggEntries(aggvalues.itervalues())
-                            while targetpoint is not None and entry.timestamp > targetpoint:
-                                wrkdata.append(StatsEntry(targetpoint, aggregation))
-                                try:
-                                    targetpoint = pointiter.next()
-                                except StopIteration:
-                                    targetpoint = None
-                        try:
-                            curvalues[k] = iterators[k].next()
-                            aggvalues[k] = curvalues[k]
-                        except StopIteration:
-                            del iterators[k]
-                            del curvalues[k]
-                    if entry and targetpoint is not None:
-                        wrkdata.append(StatsEntry(targetpoint, aggEntries(aggvalues.itervalues())))
-
-        return aggdb
-
-    def _averageUsefulWork(self, aggdb):
-        avgdb = { }
-        for target, exps in aggdb.iteritems():
-            tgdata = avgdb.setdefault(target, {})
-            
-            for tgcount, exp in exps.iteritems():
-                for workercount, entries in exp.iteritems():
-                    wrkdata = tgdata.setdefault(workercount, {})
-                    for entry in entries:
-                        avg = wrkdata.setdefault(entry.timestamp, AverageEntry())
-                        avg.entries.append(entry.stats.get(Stats.TOTAL_PROC_INSTRUCTIONS, 0) - 
-                                           entry.stats.get(Stats.TOTAL_REPLAY_INSTRUCTIONS, 0))
-
-            for workercount, entries in tgdata.iteritems():
-                for timestamp, avg in entries.iteritems():
-                    avg.computeAverage()
-
-        return avgdb
-
-    def printUsefulWork(self, aggdb, target="memcached"):
-        tgdata = aggdb[target]
-        for workercount in sorted(tgdata.keys()):
-            entries = tgdata[workercount]
-            print "%d:" % workercount,
-            for timestamp in sorted(entries.keys()):
-                entry = entries[timestamp]
-                print "%d=%d,%.4f%%,%d" % (
-                    timestamp, int(entry.average), 
-                    100.0*int(entry.stdev)/int(entry.average) if int(entry.average) else 0.0, 
-                    len(entry.entries)),
-            print
+from statsminer import StatsMiner
+from minecache import MineCache, DEFAULT_CACHE_SIZE
+from warehouse import ResultsWarehouse, DEFAULT_WAREHOUSE_PATH
+import arrayexport
+import statsarrays
 
 def main():
     parser = ArgumentParser(description="Mine Cloud9 experiments.",
@@ -238,8 +47,43 @@ def main():
     parser.add_argument("-m", action="append", help="Mine only the specified machines")
     parser.add_argument("-w", type=int, help="Mine only data specific to a number of workers")
     parser.add_argument("-s", type=int, help="Sample every number of specified seconds")
+    parser.add_argument("-a", "--agent", action="store_true", default=False,
+                        help="Resample the stats on the machines, at full resolution")
+    parser.add_argument("-z", "--compress", action="store_true", default=False,
+                        help="Compress the mined data on the machines before the transfer")
+    parser.add_argument("-l", "--local", action="store_true", default=False,
+                        help="Read the stats at full resolution from the experiment directories, "
+                        "mounted locally at the same path")
+    parser.add_argument("--numpy", action="store_true", default=False,
+                        help="Keep the worker stats in NumPy arrays")
+    parser.add_argument("--no-cache", action="store_true", default=False,
+                        help="Do not use the local cache of mined files")
+    parser.add_argument("--clear-cache", action="store_true", default=False,
+                        help="Drop the cached stats of the mined machines before mining")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        help="Maximum size of the stats cache, in MB")
+    parser.add_argument("--export", metavar="DIR",
+                        help="Also write the stats as NumPy arrays under the specified directory")
+    parser.add_argument("--ingest", action="store_true", default=False,
+                        help="Store the mined stats in the results warehouse")
+    parser.add_argument("--from-warehouse", action="store_true", default=False,
+                        help="Read the stats from the results warehouse instead of the machines")
+    parser.add_argument("--warehouse", default=DEFAULT_WAREHOUSE_PATH,
+                        help="Path of the results warehouse")
+    parser.add_argument("--since", help="With --from-warehouse, only use the experiments started "
+                        "since a date (YYYY-MM-DD) or an age (e.g. 30d)")
+    parser.add_argument("--until", help="With --from-warehouse, only use the experiments started "
+                        "before a date (YYYY-MM-DD) or an age (e.g. 30d)")
 
     args = parser.parse_args()
+    if args.local and args.agent:
+        parser.error("--local and --agent are mutually exclusive")
+    if args.ingest and args.from_warehouse:
+        parser.error("--ingest and --from-warehouse are mutually exclusive")
+    if args.export and not arrayexport.isAvailable():
+        parser.error("--export requires NumPy to be installed")
+    if args.numpy and not statsarrays.isAvailable():
+        parser.error("--numpy requires NumPy to be installed")
     tests = args.tests[:]
 
     if args.f:
@@ -248,8 +92,29 @@ def main():
             tests.extend(f.read().split())
             f.close()
 
-    statminer = StatsMiner(args.hosts, hfilter=args.m)
-    results = statminer.analyzeExperiments(tests, wcfilter=args.w, samplerate=args.s)
+    cache = None
+    if not args.no_cache and not args.from_warehouse:
+        cache = MineCache("stats", maxsize=args.cache_size)
+        if args.clear_cache:
+            cache.invalidate(hosts=set(args.m) if args.m else None)
+
+    statminer = StatsMiner(args.hosts, hfilter=args.m, cache=cache, agent=args.agent,
+                           compress=args.compress, arrays=args.numpy, local=args.local)
+    if args.from_warehouse:
+        warehouse = ResultsWarehouse(args.warehouse)
+        results = statminer.loadExperiments(warehouse, tests, wcfilter=args.w, samplerate=args.s,
+                                            since=args.since, until=args.until)
+        warehouse.close()
+    else:
+        results = statminer.analyzeExperiments(tests, wcfilter=args.w, samplerate=args.s)
+        if args.ingest:
+            warehouse = ResultsWarehouse(args.warehouse)
+            statminer.ingestResults(warehouse)
+            warehouse.close()
+
+    if args.export:
+        statminer.exportStats(args.export, results)
+
     statminer.printUsefulWork(results, args.target)
 
 if __name__ == "__main__":
@@ -0,0 +1,226 @@
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+"""
+Remote reduction agent for the coverage and stats miners.
+
+This file is not imported by the miners. Its source is shipped over ssh to
+"python -" on each host, followed by a call to run() with the mining
+parameters, so it has to stay self-contained and runnable by any Python
+the hosts may have. The agent reads the experiment files at full
+resolution and only sends back per-worker summaries.
+"""
+
+import sys
+import os
+import re
+import glob
+import multiprocessing
+
+# The re module supports at most 100 groups in a regex
+MAX_LAYOUT_GROUPS = 100
+
+
+def parseCoverage(line, ffilter):
+    tokens = line.split()
+    timestamp = float(tokens[0])
+    total = 0
+    covered = 0
+    for t in tokens[1:]:
+        (k, v) = t.split("=")
+        (newcovAdd, totalAdd) = (int(x) for x in v.split("(")[0].split("/")[:2]) # 26/30(86.67)
+        if ffilter:
+            if k in ffilter:
+                total += totalAdd
+                covered += newcovAdd
+        elif k == "<global>":
+            total = totalAdd
+            covered = newcovAdd
+            break
+
+    return timestamp, (0 if total == 0 else 100. * covered / total)
+
+def compileLayout(line, ffilter):
+    """Returns a regex matching the coverage lines with the same function
+    columns as line, which captures the timestamp and the covered/total
+    counts of the filtered functions. Returns False if the regex would need
+    more groups than the re module supports."""
+    pattern = [r"(\S+)"]
+    groups = 1
+    for t in line.split()[1:]:
+        k, sep, _ = t.partition("=")
+        if not sep:
+            return None
+        if k in ffilter:
+            groups += 2
+            if groups > MAX_LAYOUT_GROUPS:
+                return False
+            pattern.append(r"\s+%s=([-+]?\d+)/([-+]?\d+)(?:[/(][^\s=]*)?" % re.escape(k))
+        else:
+            pattern.append(r"\s+%s=\S+" % re.escape(k))
+    return re.compile("".join(pattern) + "$")
+
+def parseFilteredCoverage(match):
+    values = match.groups()
+    covered = sum(int(x) for x in values[1::2])
+    total = sum(int(x) for x in values[2::2])
+    return float(values[0]), (0 if total == 0 else 100. * covered / total)
+
+def reduceCoverage(f, ffilter, targetcov):
+    """Returns the points of a coverage file that matter to the miner. When
+    target coverages are measured, these are the points raising the
+    coverage above all the previous ones, which give the time to reach any
+    coverage level. Otherwise, only the first point reaching the maximum
+    coverage is returned."""
+    points = []
+    maxpoint = None
+    layout = None
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            match = layout.match(line) if layout else None
+            if match:
+                timestamp, cov = parseFilteredCoverage(match)
+            else:
+                if ffilter and layout is not False:
+                    layout = compileLayout(line, ffilter)
+                timestamp, cov = parseCoverage(line, ffilter)
+        except Exception:
+            sys.stderr.write("-- NOTE: Cannot process covdata '%s'\n" % line)
+            continue
+        if maxpoint is None or cov > maxpoint[1]:
+            maxpoint = (timestamp, cov)
+            if targetcov:
+                points.append(maxpoint)
+
+    if maxpoint is not None and not targetcov:
+        points.append(maxpoint)
+    return points
+
+def resampleStats(f, samplerate):
+    """Yields the (timestamp, stats) samples of a stats file on a grid of
+    samplerate seconds. The value at a grid point is the first sample taken
+    after it, or the last sample of the file."""
+    point = 0
+    last = None
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        tokpair = line.split(" ", 1)
+        timestamp = float(tokpair[0])
+        last = tokpair[1] if len(tokpair) > 1 else ""
+        while point < timestamp:
+            yield point, last
+            point += samplerate
+
+    if last is not None:
+        yield point, last
+
+def findFiles(testdirs, name):
+    paths = []
+    for testdir in testdirs:
+        for root in glob.glob("./" + testdir):
+            for dirpath, _, filenames in os.walk(root):
+                if name in filenames:
+                    paths.append(os.path.join(dirpath, name))
+    return sorted(paths)
+
+def filterBalancerLog(args):
+    """Reads a load balancer log once, and returns its path followed by the
+    lines the balancer miner needs: every skip-th "IN TOTAL" line and the
+    last one, then the transfer requests."""
+    path, skip = args
+    totals = []
+    transfers = []
+    last = None
+    count = 0
+    try:
+        f = open(path, "r")
+    except IOError:
+        sys.stderr.write("-- NOTE: Cannot open '%s'\n" % path)
+        return []
+    for line in f:
+        if "IN TOTAL" in line:
+            if count % skip == 0:
+                totals.append(line)
+                last = None
+            else:
+                last = line
+            count += 1
+        if "Created transfer request" in line:
+            transfers.append(line)
+    f.close()
+
+    if last is not None:
+        totals.append(last)
+    return ["%s\n" % path] + [line if line.endswith("\n") else line + "\n"
+                              for line in totals + transfers]
+
+def mineBalancerLogs(config):
+    if hasattr(multiprocessing, "get_context"):
+        # The functions of this script can only reach the workers by fork
+        pool = multiprocessing.get_context("fork").Pool(config["jobs"])
+    else:
+        pool = multiprocessing.Pool(config["jobs"])
+    try:
+        paths = findFiles(config["testdirs"], "out-lb.txt")
+        for lines in pool.imap(filterBalancerLog, [(path, config["skip"]) for path in paths]):
+            sys.stdout.writelines(lines)
+    finally:
+        pool.close()
+        pool.join()
+    sys.stdout.flush()
+
+def run(config):
+    if config["mode"] == "balancer":
+        mineBalancerLogs(config)
+        return
+
+    out = sys.stdout
+    for path in config["paths"]:
+        try:
+            f = open(path, "r")
+        except IOError:
+            sys.stderr.write("-- NOTE: Cannot open '%s'\n" % path)
+            continue
+        out.write("%s\n" % path)
+        if config["mode"] == "coverage":
+            ffilter = set(config["ffilter"]) if config["ffilter"] else None
+            for timestamp, cov in reduceCoverage(f, ffilter, config["targetcov"]):
+                out.write("%r %r\n" % (timestamp, cov))
+        elif config["mode"] == "stats":
+            for timestamp, stats in resampleStats(f, config["samplerate"]):
+                out.write("%d %s\n" % (timestamp, stats))
+        f.close()
+    out.flush()
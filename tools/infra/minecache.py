@@ -0,0 +1,149 @@
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+"""
+Implements the MineCache class, a local on-disk cache of the data the
+miners extract from the experiment files.
+"""
+
+import os
+import cPickle
+import hashlib
+
+_CACHE_DIR = "./cache"
+
+DEFAULT_CACHE_SIZE = 1024 # MB
+
+
+class MineCache:
+    """Maps a (host, path, parameters) key to the data parsed out of a
+    remote file, as long as the size and modification time of the file do
+    not change. Each entry is a separate pickle file, and the least recently
+    used entries are evicted when the cache grows over maxsize MB."""
+
+    def __init__(self, kind, cachedir=_CACHE_DIR, maxsize=DEFAULT_CACHE_SIZE):
+        self.cachedir = os.path.join(cachedir, kind)
+        self.maxsize = maxsize * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+
+    def _getEntryPath(self, key):
+        return os.path.join(self.cachedir, "%s.pickle" % hashlib.sha1(repr(key)).hexdigest())
+
+    def getEntry(self, key):
+        """Returns the cached entry of the key, a dictionary holding the size,
+        mtime, data and state of the file when it was cached, or None."""
+        entryPath = self._getEntryPath(key)
+        try:
+            f = open(entryPath, "rb")
+            try:
+                entry = cPickle.load(f)
+            finally:
+                f.close()
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        # The entries cached before the resume state was kept are refetched
+        if entry.get("key") != key or "state" not in entry:
+            self.misses += 1
+            return None
+
+        # Keep track of the last use, for the eviction policy
+        os.utime(entryPath, None)
+        self.hits += 1
+        return entry
+
+    def get(self, key, size, mtime):
+        """Returns the cached data for the key, or None if the file changed
+        since it was cached."""
+        entry = self.getEntry(key)
+        if entry is None or entry["size"] != size or entry["mtime"] != mtime:
+            return None
+        return entry["data"]
+
+    def put(self, key, size, mtime, data, state=None):
+        """Caches the data of a file. The state is any extra information
+        needed to resume reading the file later."""
+        entryPath = self._getEntryPath(key)
+        tmpPath = "%s.%d.tmp" % (entryPath, os.getpid())
+        f = open(tmpPath, "wb")
+        try:
+            cPickle.dump({ "key": key, "size": size, "mtime": mtime, "data": data, "state": state },
+                         f, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            f.close()
+        os.rename(tmpPath, entryPath)
+
+    def _listEntries(self):
+        entries = []
+        for name in os.listdir(self.cachedir):
+            entryPath = os.path.join(self.cachedir, name)
+            try:
+                st = os.stat(entryPath)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entryPath))
+        return entries
+
+    def invalidate(self, hosts=None):
+        """Removes the entries of the specified hosts, or all the entries.
+        Returns the number of entries removed."""
+        count = 0
+        for _, _, entryPath in self._listEntries():
+            if hosts is not None:
+                try:
+                    f = open(entryPath, "rb")
+                    try:
+                        host = cPickle.load(f)["key"][0]
+                    finally:
+                        f.close()
+                except (IOError, EOFError, cPickle.UnpicklingError):
+                    host = None
+                if host is not None and host not in hosts:
+                    continue
+            os.remove(entryPath)
+            count += 1
+        return count
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in
+        its maximum size."""
+        entries = sorted(self._listEntries())
+        total = sum(entry[1] for entry in entries)
+        for _, size, entryPath in entries:
+            if total <= self.maxsize:
+                break
+            os.remove(entryPath)
+            total -= size
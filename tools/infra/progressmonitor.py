@@ -0,0 +1,258 @@
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+"""
+Implements the ProgressMonitor class, which reports the coverage and the
+throughput of the running experiments.
+"""
+
+import time
+import threading
+
+from common import runBashScript, runParallel, killAfter, readLines, getTransport
+from common import DEFAULT_JOBS
+from statsminer import Stats
+from subprocess import PIPE
+
+DEFAULT_REFRESH = 60
+
+class WorkerProgress:
+    def __init__(self, host, path):
+        self.host = host
+        self.path = path
+        self.offsets = { }
+        self.coverage = None
+        self.stats = None
+
+
+class ProgressMonitor:
+    """Follows the coverage and stats files of the workers while the
+    experiments run. Each poll asks every host, over a single ssh session,
+    for the lines appended since the previous poll, and only the last
+    complete line of each file is sent back. Polls happen at most once
+    every refresh seconds, and are given up after refresh seconds. They
+    run in a background thread, so that poll() returns at once. The
+    progress is only logged when report is set, but the coverage history
+    of the experiments is kept either way."""
+
+    def __init__(self, hosts, refresh=DEFAULT_REFRESH, log=None, jobs=DEFAULT_JOBS, sshOptions="",
+                 report=True):
+        self.hosts = hosts
+        self.refresh = refresh
+        self.log = log
+        self.report = report
+        self.jobs = jobs
+        self.sshOptions = sshOptions
+        self.experiments = { }
+        self.slots = { }
+        self.nextPoll = None
+        self.lastUseful = { }
+        self.history = { }
+        # Guards the experiments and their history against the poll thread
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def addWorker(self, expid, host, workerID, sshSlot=0):
+        """Follows a worker, whose output directory is worker-<workerID>
+        in the expid directory of the host."""
+        progress = WorkerProgress(host, "%s/worker-%d" % (expid, workerID))
+        self._lock.acquire()
+        self.experiments.setdefault(expid, []).append(progress)
+        # Stay off the ssh slots used by the workers
+        self.slots[host] = max(self.slots.get(host, 0), sshSlot + 1)
+        self._lock.release()
+
+    def removeExperiment(self, expid):
+        """Stops following the workers of an experiment."""
+        self._lock.acquire()
+        self.experiments.pop(expid, None)
+        self.lastUseful.pop(expid, None)
+        self.history.pop(expid, None)
+        self._lock.release()
+
+    def getCoverageGain(self, expid, window):
+        """Returns how much the coverage of an experiment grew over the last
+        window seconds, in percentage points, or None if its coverage was
+        not followed for that long yet."""
+        self._lock.acquire()
+        try:
+            history = self.history.get(expid)
+            if not history:
+                return None
+            now, coverage = history[-1]
+            start = None
+            for index, (timestamp, _) in enumerate(history):
+                if timestamp > now - window:
+                    break
+                start = index
+            if start is None:
+                return None
+            # The older samples are not needed anymore
+            del history[:start]
+            return coverage - history[0][1]
+        finally:
+            self._lock.release()
+
+    def poll(self):
+        """Starts refreshing and reporting the progress in the background,
+        if the refresh time came and the previous refresh is over."""
+        now = time.time()
+        if self.nextPoll is None:
+            # Give the workers time to start
+            self.nextPoll = now + self.refresh
+        if now < self.nextPoll or (self._thread and self._thread.is_alive()):
+            return
+        self.nextPoll = now + self.refresh
+
+        workers = { }
+        self._lock.acquire()
+        for progresses in self.experiments.itervalues():
+            for progress in progresses:
+                workers.setdefault(progress.host, []).append(progress)
+        self._lock.release()
+
+        self._thread = threading.Thread(target=self._refresh, args=(workers,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def join(self):
+        """Waits for the refresh in progress, if any."""
+        if self._thread is not None:
+            self._thread.join()
+
+    def _refresh(self, workers):
+        for host, _, error in runParallel(lambda host: self._pollHost(host, workers[host]),
+                                          sorted(workers), jobs=self.jobs):
+            if error:
+                self._logMsg("NOTE: Cannot poll the progress on host '%s', error: %s" % (host, error))
+
+        self._report(time.time())
+
+    def _pollHost(self, host, progresses):
+        files = { }
+        for progress in progresses:
+            for name in ("c9-coverage.txt", "c9-stats.txt"):
+                files["%s/%s" % (progress.path, name)] = (progress, name)
+
+        proc = runBashScript("""
+            %(shell)s <<'EOF'
+            cd %(expdir)s
+            # The code below is run remotely
+            c9last() {
+                FILE=$1; OFFSET=$2
+                [ -f $FILE ] || return 0
+                SIZE=$(stat -c %%s $FILE)
+                [ $SIZE -lt $OFFSET ] && OFFSET=0
+                chunk() { tail -c +$((OFFSET + 1)) $FILE | head -c $(($1 - OFFSET)); }
+                END=$SIZE
+                if [ $SIZE -gt $OFFSET ] && [ "$(chunk $SIZE | tail -c 1 | wc -l)" -eq 0 ]; then
+                    END=$((SIZE - $(chunk $SIZE | tail -n 1 | wc -c)))
+                fi
+                echo $FILE
+                echo "@ $END"
+                [ $END -gt $OFFSET ] && chunk $END | tail -n 1
+                return 0
+            }
+            %(calls)s
+            \nEOF""" % {
+                "shell": getTransport(self.hosts[host]).shellCommand(
+                    "bash -s", slot=self.slots[host], options=self.sshOptions),
+                "expdir": self.hosts[host]["expdir"],
+                "calls": "\n".join("c9last %s %d" % (path, progress.offsets.get(name, 0))
+                                   for path, (progress, name) in sorted(files.iteritems()))
+                }, stdout=PIPE)
+        timer = killAfter(proc, self.refresh)
+
+        current = None
+        for line in readLines(proc.stdout):
+            line = line.strip()
+            if line in files:
+                current = files[line]
+            elif current and line.startswith("@"):
+                current[0].offsets[current[1]] = int(line.split()[1])
+            elif current and line:
+                self._parseLine(current[0], current[1], line)
+
+        proc.wait()
+        timer.cancel()
+
+    def _parseLine(self, progress, name, line):
+        tokens = line.split()
+        try:
+            if name == "c9-stats.txt":
+                progress.stats = dict((int(k), int(v)) for k, v in
+                                      (token.split("=") for token in tokens[1:]))
+                return
+            for token in tokens[1:]:
+                k, _, v = token.partition("=")
+                if k == "<global>":
+                    covered, total = (int(x) for x in v.split("(")[0].split("/")[:2])
+                    progress.coverage = 100. * covered / total if total else 0.
+        except ValueError:
+            self._logMsg("NOTE: Cannot parse the progress of '%s': '%s'" % (progress.path, line))
+
+    def _report(self, now):
+        self._lock.acquire()
+        try:
+            self._reportExperiments(now)
+        finally:
+            self._lock.release()
+
+    def _reportExperiments(self, now):
+        for expid in sorted(self.experiments):
+            progresses = self.experiments[expid]
+            coverages = [p.coverage for p in progresses if p.coverage is not None]
+            instructions = sum(p.stats.get(Stats.TOTAL_PROC_INSTRUCTIONS, 0)
+                               for p in progresses if p.stats)
+            replayed = sum(p.stats.get(Stats.TOTAL_REPLAY_INSTRUCTIONS, 0)
+                           for p in progresses if p.stats)
+            useful = instructions - replayed
+
+            rate = None
+            if expid in self.lastUseful:
+                lastTime, lastUseful = self.lastUseful[expid]
+                if now > lastTime:
+                    rate = (useful - lastUseful) / (now - lastTime)
+            self.lastUseful[expid] = (now, useful)
+            if coverages:
+                self.history.setdefault(expid, []).append((now, max(coverages)))
+
+            if not self.report:
+                continue
+            self._logMsg("Progress of %s: coverage %s, %s useful instr/s, replay ratio %s" % (
+                    expid,
+                    "%.2f%%" % max(coverages) if coverages else "-",
+                    "%d" % rate if rate is not None else "-",
+                    "%.2f%%" % (100. * replayed / instructions) if instructions else "-"))
+
+    def _logMsg(self, msg):
+        if self.log:
+            self.log(msg)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+from argparse import ArgumentParser
+from warehouse import ResultsWarehouse, DEFAULT_WAREHOUSE_PATH, getFilterName
+
+def printRows(header, rows):
+    rows = [tuple("-" if value is None else str(value) for value in row) for row in rows]
+    widths = [max([len(name)] + [len(row[i]) for row in rows]) for i, name in enumerate(header)]
+    print "  ".join(name.ljust(width) for name, width in zip(header, widths))
+    print "="*(sum(widths) + 2*(len(widths) - 1))
+    for row in rows:
+        print "  ".join(value.ljust(width) for value, width in zip(row, widths))
+
+def main():
+    parser = ArgumentParser(description="Query the Cloud9 results warehouse.",
+                            fromfile_prefix_chars="@")
+    parser.add_argument("--warehouse", default=DEFAULT_WAREHOUSE_PATH,
+                        help="Path of the results warehouse")
+    subparsers = parser.add_subparsers(dest="command")
+
+    for name, help in [("experiments", "List the stored experiments"),
+                       ("coverage", "Show the maximum coverage of the stored experiments")]:
+        subparser = subparsers.add_parser(name, help=help)
+        subparser.add_argument("tests", nargs="*", help="Test names")
+        subparser.add_argument("-t", "--target", help="Only show the experiments of a testing target")
+        subparser.add_argument("-w", type=int, help="Only show the experiments with a number of workers")
+        subparser.add_argument("--since", help="Only show the experiments started since a date "
+                               "(YYYY-MM-DD) or an age (e.g. 30d)")
+        subparser.add_argument("--until", help="Only show the experiments started before a date "
+                               "(YYYY-MM-DD) or an age (e.g. 30d)")
+        if name == "coverage":
+            subparser.add_argument("-x", action="append",
+                                   help="Show the coverage mined for the functions listed in the specified file")
+
+    subparser = subparsers.add_parser("sql", help="Run an SQL query on the warehouse")
+    subparser.add_argument("query", help="SQL query")
+
+    args = parser.parse_args()
+    warehouse = ResultsWarehouse(args.warehouse)
+
+    if args.command == "sql":
+        cursor = warehouse.db.execute(args.query)
+        if cursor.description:
+            printRows([column[0] for column in cursor.description], cursor.fetchall())
+        else:
+            warehouse.db.commit()
+        warehouse.close()
+        return
+
+    filters = {
+        "testdirs": args.tests,
+        "target": args.target,
+        "workercount": args.w,
+        "since": args.since,
+        "until": args.until
+        }
+
+    if args.command == "experiments":
+        printRows(["Date", "Test", "Target", "Workers", "Trial", "Timelines", "Mined"],
+                  warehouse.listExperiments(**filters))
+    elif args.command == "coverage":
+        ffilter = None
+        if args.x:
+            ffilter = []
+            for fname in args.x:
+                f = open(fname, "r")
+                ffilter.extend(f.read().split())
+                f.close()
+        printRows(["Date", "Test", "Target", "Workers", "Trial", "Coverage", "Duration"],
+                  [row[:5] + ("%.2f%%" % row[5], "%d" % row[6]) for row in
+                   warehouse.getMaxCoverage(ffilter=getFilterName(ffilter), **filters)])
+
+    warehouse.close()
+
+if __name__ == "__main__":
+    main()
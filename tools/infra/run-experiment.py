@@ -33,6 +33,7 @@
 from expmanager import ExperimentManager
 from argparse import ArgumentParser
 from expmanager import DEFAULT_BASE_PORT
+from common import DEFAULT_JOBS
 
 def main():
     parser = ArgumentParser(description="Run Cloud9 experiments.",
@@ -53,6 +54,20 @@ def main():
     parser.add_argument("--strategy", help="Worker search strategy.")
     parser.add_argument("--base-port", type=int, default=DEFAULT_BASE_PORT, 
                         help="Base port to use.")
+    parser.add_argument("-j", type=int, default=DEFAULT_JOBS,
+                        help="Number of hosts to initialize concurrently")
+    parser.add_argument("--monitor", type=int, metavar="SECONDS",
+                        help="Print the coverage and throughput of the running experiments "
+                        "every number of seconds")
+    parser.add_argument("--batch-launch", action="store_true", default=False,
+                        help="Launch the workers of each host through a single session, "
+                        "instead of one session per worker")
+    parser.add_argument("--work-queue", action="store_true", default=False,
+                        help="Ignore the stages of the schedule and start each experiment as soon "
+                        "as its hosts have enough free cores")
+    parser.add_argument("--plateau", type=float, nargs=2, metavar=("PERCENT", "MINUTES"),
+                        help="Stop an experiment early when its coverage grew by less than "
+                        "PERCENT percentage points over the last MINUTES minutes")
     
     args = parser.parse_args()
 
@@ -62,8 +77,13 @@ def main():
                                 duration=args.duration,
                                 balancetout=args.lb_stop,
                                 strategy=args.strategy,
-                                basePort=args.base_port)
-    manager.initHosts()
+                                basePort=args.base_port,
+                                monitorRate=args.monitor,
+                                batchLaunch=args.batch_launch,
+                                workQueue=args.work_queue,
+                                plateau=((args.plateau[0], args.plateau[1] * 60)
+                                         if args.plateau else None))
+    manager.initHosts(jobs=args.j)
     manager.runExperiment()
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+"""
+NumPy-backed stats timelines.
+
+A worker timeline is stored as an array of timestamps and a matrix of
+counters, with one row per sample and one column per stat ID. Resampling
+the workers on the sampling grid and averaging the trials are then array
+operations. NumPy is optional, the miners only use this module when asked.
+"""
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def isAvailable():
+    return numpy is not None
+
+class StatsTimeline:
+    """The timestamps and counters of a worker. Timelines can be sliced and
+    added like the lists of samples, which is what resuming a cached
+    timeline needs."""
+
+    def __init__(self, timestamps, counters):
+        self.timestamps = timestamps
+        self.counters = counters
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        return StatsTimeline(self.timestamps[index], self.counters[index])
+
+    def __add__(self, other):
+        return concatTimelines(self, other)
+
+class TimelineBuilder:
+    """Builds a timeline one sample at a time, in arrays that double in
+    size when full, so the samples never exist as a list of dicts."""
+
+    def __init__(self):
+        self.count = 0
+        self.timestamps = numpy.zeros(16, dtype=numpy.float64)
+        self.counters = numpy.zeros((16, 0), dtype=numpy.int64)
+
+    def add(self, timestamp, stats):
+        if self.count == len(self.timestamps):
+            self.timestamps = numpy.concatenate((self.timestamps, numpy.zeros_like(self.timestamps)))
+            self.counters = numpy.vstack((self.counters, numpy.zeros_like(self.counters)))
+        if stats:
+            self.counters = _widen(self.counters, max(stats) + 1)
+        self.timestamps[self.count] = timestamp
+        for k, v in stats.iteritems():
+            self.counters[self.count, k] = v
+        self.count += 1
+
+    def build(self):
+        return StatsTimeline(self.timestamps[:self.count].copy(), self.counters[:self.count].copy())
+
+def iterateSamples(timeline):
+    """Yields the (timestamp, stats dict) samples of a timeline. The stats
+    that are 0 are left out, as they cannot be told apart from the ones
+    that were not reported."""
+    for timestamp, row in zip(timeline.timestamps, timeline.counters):
+        yield float(timestamp), dict((int(k), int(row[k])) for k in numpy.flatnonzero(row))
+
+def getColumn(counters, stat):
+    """Returns the values of a stat, which is 0 where it was not reported."""
+    if stat >= counters.shape[1]:
+        return numpy.zeros(len(counters), dtype=numpy.int64)
+    return counters[:, stat]
+
+def _widen(counters, width):
+    if counters.shape[1] >= width:
+        return counters
+    return numpy.hstack((counters, numpy.zeros((len(counters), width - counters.shape[1]),
+                                               dtype=counters.dtype)))
+
+def buildTimeline(samples):
+    """Builds a timeline out of (timestamp, stats dict) samples."""
+    timestamps = []
+    rows, cols, values = [], [], []
+    for i, (timestamp, stats) in enumerate(samples):
+        timestamps.append(timestamp)
+        for k, v in stats.items():
+            rows.append(i)
+            cols.append(k)
+            values.append(v)
+
+    counters = numpy.zeros((len(timestamps), max(cols) + 1 if cols else 0), dtype=numpy.int64)
+    counters[rows, cols] = values
+    return StatsTimeline(numpy.array(timestamps, dtype=numpy.float64), counters)
+
+def concatTimelines(first, second):
+    width = max(first.counters.shape[1], second.counters.shape[1])
+    return StatsTimeline(numpy.concatenate((first.timestamps, second.timestamps)),
+                         numpy.vstack((_widen(first.counters, width), _widen(second.counters, width))))
+
+def resampleTimelines(timelines, samplerate):
+    """Sums worker timelines on a grid of samplerate seconds. Each grid
+    point adds up, for every worker, its first sample past the point (or
+    its last sample). The grid ends with the first point at or past the
+    last sample. Returns the matrix of sums, one row per grid point."""
+    timelines = [timeline for timeline in timelines if len(timeline)]
+    if not timelines:
+        return numpy.zeros((0, 0), dtype=numpy.int64)
+
+    last = max(timeline.timestamps[-1] for timeline in timelines)
+    count = max(int(math.ceil(last / samplerate)), 0)
+    while samplerate * count < last:
+        count += 1
+    while count > 0 and samplerate * (count - 1) >= last:
+        count -= 1
+    grid = samplerate * numpy.arange(count + 1, dtype=numpy.float64)
+
+    width = max(timeline.counters.shape[1] for timeline in timelines)
+    sums = numpy.zeros((len(grid), width), dtype=numpy.int64)
+    for timeline in timelines:
+        indices = numpy.minimum(numpy.searchsorted(timeline.timestamps, grid, side="right"),
+                                len(timeline) - 1)
+        sums[:, :timeline.counters.shape[1]] += timeline.counters[indices]
+    return sums
+
+def stackResampled(timelines):
+    """Same as resampleTimelines, for timelines that already are on the
+    grid. Workers that finished early contribute their last sample."""
+    timelines = [timeline for timeline in timelines if len(timeline)]
+    if not timelines:
+        return numpy.zeros((0, 0), dtype=numpy.int64)
+
+    length = max(len(timeline) for timeline in timelines)
+    width = max(timeline.counters.shape[1] for timeline in timelines)
+    sums = numpy.zeros((length, width), dtype=numpy.int64)
+    for timeline in timelines:
+        indices = numpy.minimum(numpy.arange(length), len(timeline) - 1)
+        sums[:, :timeline.counters.shape[1]] += timeline.counters[indices]
+    return sums
+
+def averageSeries(series):
+    """Averages integer series of different lengths, point by point.
+    Returns the number of values, the average and the standard deviation
+    at each point, computed as AverageEntry does."""
+    length = max(len(values) for values in series) if series else 0
+    matrix = numpy.zeros((len(series), length), dtype=numpy.int64)
+    mask = numpy.zeros((len(series), length), dtype=bool)
+    for i, values in enumerate(series):
+        matrix[i, :len(values)] = values
+        mask[i, :len(values)] = True
+
+    counts = mask.sum(axis=0)
+    averages = numpy.floor_divide(matrix.sum(axis=0), numpy.maximum(counts, 1))
+    deviations = numpy.where(mask, matrix - averages, 0).astype(numpy.float64)
+    variances = numpy.floor((deviations * deviations).sum(axis=0) / numpy.maximum(counts - 1, 1))
+    stdevs = numpy.where(counts > 1, numpy.sqrt(variances), 0.0)
+    return counts, averages, stdevs
@@ -0,0 +1,558 @@
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+import sys
+import subprocess
+import re
+import math
+import heapq
+import itertools
+
+from common import readHosts, runBashScript, isExperimentRejected
+from common import AverageEntry, readLines, listRemoteFiles, runAgent
+from common import TransferMeter, getSSHCounters, tailRemoteFiles, getSampleFilter, appendSampledLines
+from common import listLocalFiles, dumpLocalFiles, getDistinctLocalHosts
+import statsarrays
+import arrayexport
+from subprocess import PIPE
+
+DEFAULT_SAMPLERATE = 60
+
+class Stats:
+    TOTAL_PROC_INSTRUCTIONS = 0
+    TOTAL_PROC_JOBS = 1
+    TOTAL_REPLAYED_JOBS = 14
+    TOTAL_EXPORTED_JOBS = 8
+    TOTAL_IMPORTED_JOBS = 9
+    TOTAL_DROPPED_JOBS = 10
+    TOTAL_FORKED_STATES = 15
+    TOTAL_FINISHED_STATES = 16
+    TOTAL_TREE_PATHS = 17
+    TOTAL_REPLAY_INSTRUCTIONS = 20
+    CURRENT_JOB_COUNT = 11
+    CURRENT_ACTIVE_STATE_COUNT = 18
+    CURRENT_STATE_COUNT = 19
+
+class StatsEntry:
+    def __init__(self, timestamp=None, stats=None):
+        self.timestamp = timestamp
+        self.stats = stats
+
+class StatsMiner:
+    def __init__(self, hostsName, hfilter=None, cache=None, agent=False, compress=False,
+                 arrays=False, local=False):
+        self.hosts, self.localhost = readHosts(hostsName)
+        self.hfilter = set(hfilter) if hfilter else None
+        self.cache = cache
+        self.agent = agent
+        self.compress = compress
+        self.arrays = arrays
+        self.local = local
+
+        self.pathRe = re.compile(r"^./([^/]+)/([^/-]+)-(\d+)(-(\d+))?/worker-(\d+)/c9-stats.txt$")
+
+    def _logMsg(self, msg):
+        print >>sys.stderr, "-- %s" % msg
+
+    def analyzeExperiments(self, explist, wcfilter=None, samplerate=None):
+        statsdb = { }
+        self.timelines = { }
+        if not samplerate:
+            samplerate = DEFAULT_SAMPLERATE
+
+        hosts = sorted(host for host in self.hosts
+                       if not self.hfilter or host in self.hfilter)
+        if self.local:
+            hosts = getDistinctLocalHosts(self.hosts, hosts)
+
+        for host in hosts:
+            self.timelines[host] = self._pollStats(host, explist, statsdb, wcfilter=wcfilter,
+                                                   samplerate=samplerate)
+
+        if self.cache:
+            self.cache.evict()
+
+        self._logMsg("SSH connections: %d opened, %d reused." % getSSHCounters())
+
+        return self._summarizeStats(statsdb, samplerate)
+
+    def loadExperiments(self, warehouse, explist=None, wcfilter=None, samplerate=None,
+                        since=None, until=None):
+        """Same as analyzeExperiments, with the stats stored in a results
+        warehouse instead of the experiment files. Without a list of tests,
+        all the stored experiments are loaded."""
+        statsdb = { }
+        self.timelines = { }
+        if not samplerate:
+            samplerate = DEFAULT_SAMPLERATE
+
+        count = 0
+        rank = lambda resolution: self._rankResolution(resolution, samplerate)
+        for key, host, rows in warehouse.load("stats", rank=rank, testdirs=explist,
+                                              workercount=wcfilter, since=since, until=until):
+            testdir, target, workercount, tgcount, _ = key
+            if self.hfilter and host not in self.hfilter:
+                continue
+            if isExperimentRejected(testdir, target, workercount, tgcount):
+                continue
+            timeline = self._fromRows(rows)
+            if self.arrays:
+                timeline = statsarrays.buildTimeline(timeline)
+            self._addTimeline(statsdb, key, timeline)
+            count += 1
+        self._logMsg("Loaded %d stats timeline(s) from %s." % (count, warehouse.path))
+
+        return self._summarizeStats(statsdb, samplerate)
+
+    def ingestResults(self, warehouse):
+        """Stores the stats mined by analyzeExperiments in a results
+        warehouse, one timeline per worker."""
+        count = 0
+        for host, (resolution, timelines) in sorted(self.timelines.iteritems()):
+            records = ((host, self._getSeriesKey(path), self._toRows(timelines[path]))
+                       for path in sorted(timelines))
+            count += warehouse.ingest("stats", records, resolution=resolution)
+        self._logMsg("Stored %d stats timeline(s) in %s." % (count, warehouse.path))
+
+    def _toRows(self, timeline):
+        """Flattens a timeline into (sample, timestamp, stat, value) rows.
+        Samples without stats keep a row with no stat."""
+        if self.arrays:
+            timeline = statsarrays.iterateSamples(timeline)
+        for sample, (timestamp, stats) in enumerate(timeline):
+            if not stats:
+                yield sample, timestamp, None, None
+            for k in sorted(stats):
+                yield sample, timestamp, k, stats[k]
+
+    def _fromRows(self, rows):
+        timeline = []
+        for _, group in itertools.groupby(rows, key=lambda row: row[0]):
+            group = list(group)
+            timeline.append((group[0][1], dict((row[2], row[3]) for row in group
+                                               if row[2] is not None)))
+        return timeline
+
+    def _getResolution(self, skip, samplerate):
+        if self.local:
+            return "full"
+        elif self.agent:
+            return "grid-%d" % samplerate
+        else:
+            return "every-%d" % skip
+
+    def _rankResolution(self, resolution, samplerate):
+        """Orders the stored resolutions, the closest to the stats files
+        first. The timelines resampled by the agent are only used with the
+        same sample rate, and only in agent mode."""
+        if self.agent:
+            return 0 if resolution == "grid-%d" % samplerate else None
+        if resolution == "full":
+            return 0
+        if resolution.startswith("every-"):
+            return int(resolution[len("every-"):])
+        return None
+
+    def _getSeriesKey(self, path):
+        testdir, target, workercount, _, tgcount, workerID = self.pathRe.match(path).groups()
+        return testdir, target, int(workercount), int(tgcount) if tgcount else 1, int(workerID)
+
+    def _summarizeStats(self, statsdb, samplerate):
+        self.samplerate = samplerate
+        if self.arrays:
+            self.aggdb = self._aggregateArrays(statsdb, samplerate=samplerate)
+            return self._averageUsefulWorkArrays(self.aggdb, samplerate=samplerate)
+
+        if self.agent:
+            # The agent already resampled each worker on the grid
+            self.aggdb = self._aggregateResampled(statsdb, samplerate=samplerate)
+        else:
+            self.aggdb = self._aggregateStats(statsdb, samplerate=samplerate)
+        avgdb = self._averageUsefulWork(self.aggdb)
+        
+        return avgdb
+
+    def _isPathAccepted(self, path, wcfilter=None):
+        match = self.pathRe.match(path)
+        if not match:
+            return False
+        testdir, target, workercount, _, tgcount, _ = match.groups()
+        workercount = int(workercount)
+        if wcfilter and workercount != wcfilter:
+            return False
+        return not isExperimentRejected(testdir, target, workercount,
+                                        int(tgcount) if tgcount else 1)
+
+    def _pollStats(self, host, testdirs, statsdb, skip=5, wcfilter=None, samplerate=DEFAULT_SAMPLERATE):
+        self._logMsg("Polling stats for host %s..." % host)
+        if self.local:
+            files = listLocalFiles(self.hosts[host], testdirs, "c9-stats.txt")
+        else:
+            files = listRemoteFiles(self.hosts[host], testdirs, "c9-stats.txt")
+        files = filter(lambda entry: self._isPathAccepted(entry[0], wcfilter), files)
+
+        if self.local:
+            # Local files are cheap enough to read at full resolution
+            skip = 1
+            params = ("local",)
+        else:
+            params = ("agent", samplerate) if self.agent else skip
+        if self.arrays:
+            # The array timelines are cached apart from the sample lists
+            params = (params, "arrays")
+        timelines = { }
+        requests = []
+        for path, size, mtime in files:
+            entry = self.cache.getEntry((host, path, params)) if self.cache else None
+            if entry and entry["size"] == size and entry["mtime"] == mtime:
+                timelines[path] = entry["data"]
+                continue
+            if entry and (self.agent or entry["state"] is None or entry["state"]["offset"] > size):
+                # Cannot resume, read the file again
+                entry = None
+            requests.append((path, size, mtime, entry))
+
+        if self.cache:
+            resumed = len(filter(lambda request: request[3], requests))
+            self._logMsg("Host %s: %d cached file(s), %d to resume, %d to fetch." % (
+                    host, len(files) - len(requests), resumed, len(requests) - resumed))
+
+        if requests:
+            self._fetchStats(host, requests, timelines, params, skip=skip, samplerate=samplerate)
+
+        for path, _, _ in files:
+            if path not in timelines:
+                continue
+            self._addTimeline(statsdb, self._getSeriesKey(path), timelines[path])
+
+        return self._getResolution(skip, samplerate), timelines
+
+    def _addTimeline(self, statsdb, key, timeline):
+        """Adds the timeline of a worker, a StatsTimeline in arrays mode and a
+        list of (timestamp, stats) samples otherwise."""
+        testdir, target, workercount, tgcount, workerID = key
+
+        tgdata = statsdb.setdefault(target, {})
+        expdata = tgdata.setdefault((testdir, tgcount), {})
+        wrkdata = expdata.setdefault(workercount, {})
+        if self.arrays:
+            if workerID in wrkdata:
+                timeline = statsarrays.concatTimelines(wrkdata[workerID], timeline)
+            wrkdata[workerID] = timeline
+            return
+        entries = wrkdata.setdefault(workerID, [])
+        entries.extend(StatsEntry(timestamp, stats) for timestamp, stats in timeline)
+
+    def _fetchStats(self, host, requests, timelines, params, skip=5, samplerate=DEFAULT_SAMPLERATE):
+        positions = { }
+        if self.agent:
+            proc = runAgent(self.hosts[host], {
+                    "mode": "stats",
+                    "paths": [path for path, _, _, _ in requests],
+                    "samplerate": samplerate
+                    }, compress=self.compress, stdout=PIPE)
+        elif self.local:
+            proc = None
+            lines = dumpLocalFiles(self.hosts[host], [
+                    (path, entry["state"]["offset"] if entry else 0, size)
+                    for path, size, _, entry in requests])
+        else:
+            proc = tailRemoteFiles(self.hosts[host], [
+                    (path, entry["state"]["offset"] if entry else 0, size,
+                     getSampleFilter(skip, entry["state"]["lines"] if entry else 0))
+                    for path, size, _, entry in requests], compress=self.compress, stdout=PIPE)
+
+        if proc:
+            meter = TransferMeter()
+            lines = readLines(proc.stdout, compressed=self.compress, meter=meter)
+
+        fetched = { }
+        if self.arrays:
+            # Fill the arrays as the lines come, instead of keeping the samples
+            for path, (timestamp, stats) in self._parseStats(lines, positions):
+                if path not in fetched:
+                    fetched[path] = statsarrays.TimelineBuilder()
+                fetched[path].add(timestamp, stats)
+            fetched = dict((path, builder.build()) for path, builder in fetched.iteritems())
+            empty = statsarrays.TimelineBuilder().build()
+        else:
+            for path, sample in self._parseStats(lines, positions):
+                fetched.setdefault(path, []).append(sample)
+            empty = []
+
+        complete = True
+        if proc:
+            proc.wait()
+            self._logMsg("Host %s: received %s." % (host, meter))
+            if proc.returncode != 0:
+                self._logMsg("NOTE: Polling failed on host '%s' (exit code %d), using partial results." % (
+                        host, proc.returncode))
+                complete = False
+
+        for path, size, mtime, entry in requests:
+            if self.agent and (path in fetched or complete):
+                timeline, state = fetched.get(path, empty), None
+            elif path in positions:
+                timeline, state = appendSampledLines(entry, fetched.get(path, empty), positions[path], skip)
+            else:
+                # The transfer stopped before this file
+                if entry:
+                    timelines[path] = entry["data"]
+                continue
+
+            timelines[path] = timeline
+            if complete and self.cache:
+                self.cache.put((host, path, params), size, mtime, timeline, state)
+
+    def _parseStats(self, lines, positions=None):
+        """Turns the output of the remote stats dump into a stream of
+        (path, (timestamp, stats)) records. The resume positions of the
+        files are stored in positions."""
+        path = None
+
+        for line in lines:
+            line = line.strip()
+            if not len(line):
+                continue
+
+            if line.startswith("@"):
+                if path and positions is not None:
+                    positions[path] = tuple(int(x) for x in line.split()[1:])
+                continue
+
+            if self.pathRe.match(line):
+                path = line
+                continue
+
+            if path is None:
+                continue
+
+            tokpair = line.split(" ", 1)
+            timestamp = float(tokpair[0])
+            if len(tokpair) > 1:
+                stats = dict([(int(x[0]),int(x[1])) 
+                              for x in map(lambda token: token.split("="), tokpair[1].split())])
+            else:
+                stats = {}
+
+            yield path, (timestamp, stats)
+
+    def _aggregateStats(self, statsdb, samplerate=None):
+        if not samplerate:
+            samplerate = DEFAULT_SAMPLERATE
+
+        aggdb = { }
+        for target, exps in statsdb.iteritems():
+            tgdata = aggdb.setdefault(target, {})
+            for tgtrial, exp in exps.iteritems():
+                expdata = tgdata.setdefault(tgtrial, {})
+                for workercount, entries in exp.iteritems():
+                    expdata[workercount] = self._mergeTimelines(entries, samplerate)
+
+        return aggdb
+
+    def _mergeTimelines(self, entries, samplerate):
+        """Merges the worker timelines of an experiment into a timeline
+        sampled every samplerate seconds. Each sample adds up, for every
+        worker, its first entry past the sample time (or its last entry).
+
+        The timelines are merged through a heap, and the sums are updated
+        as each worker moves to its next entry."""
+        iterators = dict([(k, iter(v)) for k,v in entries.iteritems()])
+        curvalues = dict([(k, iterators[k].next()) for k in iterators.iterkeys()])
+
+        # Running sums, and the number of workers reporting each stat
+        sums = { }
+        counts = { }
+        for entry in curvalues.itervalues():
+            for k, v in entry.stats.iteritems():
+                sums[k] = sums.get(k, 0) + v
+                counts[k] = counts.get(k, 0) + 1
+
+        heap = [(entry.timestamp, k) for k, entry in curvalues.iteritems()]
+        heapq.heapify(heap)
+
+        result = []
+        point = 0
+        while heap:
+            timestamp, k = heap[0]
+            if timestamp > samplerate * point:
+                aggregation = dict(sums)
+                while timestamp > samplerate * point:
+                    result.append(StatsEntry(samplerate * point, aggregation))
+                    point += 1
+
+            try:
+                entry = iterators[k].next()
+            except StopIteration:
+                # The last entry of the worker stays in the sums
+                heapq.heappop(heap)
+                continue
+
+            for stat, v in curvalues[k].stats.iteritems():
+                counts[stat] -= 1
+                if counts[stat]:
+                    sums[stat] -= v
+                else:
+                    del counts[stat]
+                    del sums[stat]
+            for stat, v in entry.stats.iteritems():
+                sums[stat] = sums.get(stat, 0) + v
+                counts[stat] = counts.get(stat, 0) + 1
+            curvalues[k] = entry
+            heapq.heapreplace(heap, (entry.timestamp, k))
+
+        if curvalues:
+            result.append(StatsEntry(samplerate * point, dict(sums)))
+
+        return result
+
+    def _aggregateResampled(self, statsdb, samplerate=DEFAULT_SAMPLERATE):
+        """Same as _aggregateStats, for worker timelines that are already
+        on the sampling grid. Workers that finished early contribute their
+        last sample."""
+        aggdb = { }
+        for target, exps in statsdb.iteritems():
+            tgdata = aggdb.setdefault(target, {})
+            for tgtrial, exp in exps.iteritems():
+                expdata = tgdata.setdefault(tgtrial, {})
+                for workercount, entries in exp.iteritems():
+                    wrkdata = expdata.setdefault(workercount, [])
+                    timelines = [v for v in entries.itervalues() if v]
+                    for i in range(max(len(v) for v in timelines) if timelines else 0):
+                        aggregation = { }
+                        for timeline in timelines:
+                            for k, v in timeline[min(i, len(timeline) - 1)].stats.iteritems():
+                                aggregation[k] = aggregation.get(k, 0) + v
+                        wrkdata.append(StatsEntry(samplerate * i, aggregation))
+
+        return aggdb
+
+    def _averageUsefulWork(self, aggdb):
+        avgdb = { }
+        for target, exps in aggdb.iteritems():
+            tgdata = avgdb.setdefault(target, {})
+            
+            for tgcount, exp in exps.iteritems():
+                for workercount, entries in exp.iteritems():
+                    wrkdata = tgdata.setdefault(workercount, {})
+                    for entry in entries:
+                        avg = wrkdata.setdefault(entry.timestamp, AverageEntry())
+                        avg.entries.append(entry.stats.get(Stats.TOTAL_PROC_INSTRUCTIONS, 0) - 
+                                           entry.stats.get(Stats.TOTAL_REPLAY_INSTRUCTIONS, 0))
+
+            for workercount, entries in tgdata.iteritems():
+                for timestamp, avg in entries.iteritems():
+                    avg.computeAverage()
+
+        return avgdb
+
+    def _aggregateArrays(self, statsdb, samplerate=DEFAULT_SAMPLERATE):
+        """Same as _aggregateStats and _aggregateResampled, for workers
+        stored as NumPy timelines. Each experiment gets a matrix of sums,
+        one row per grid point."""
+        aggdb = { }
+        for target, exps in statsdb.iteritems():
+            tgdata = aggdb.setdefault(target, {})
+            for tgtrial, exp in exps.iteritems():
+                expdata = tgdata.setdefault(tgtrial, {})
+                for workercount, timelines in exp.iteritems():
+                    if self.agent:
+                        sums = statsarrays.stackResampled(timelines.values())
+                    else:
+                        sums = statsarrays.resampleTimelines(timelines.values(), samplerate)
+                    expdata[workercount] = sums
+
+        return aggdb
+
+    def _averageUsefulWorkArrays(self, aggdb, samplerate=DEFAULT_SAMPLERATE):
+        avgdb = { }
+        for target, exps in aggdb.iteritems():
+            series = { }
+            for tgcount, exp in exps.iteritems():
+                for workercount, sums in exp.iteritems():
+                    series.setdefault(workercount, []).append(
+                        statsarrays.getColumn(sums, Stats.TOTAL_PROC_INSTRUCTIONS) -
+                        statsarrays.getColumn(sums, Stats.TOTAL_REPLAY_INSTRUCTIONS))
+
+            tgdata = avgdb.setdefault(target, {})
+            for workercount, values in series.iteritems():
+                counts, averages, stdevs = statsarrays.averageSeries(values)
+                wrkdata = tgdata.setdefault(workercount, {})
+                for i in range(len(counts)):
+                    avg = wrkdata.setdefault(samplerate * i, AverageEntry())
+                    avg.entries = [int(v[i]) for v in values if i < len(v)]
+                    avg.average, avg.stdev = int(averages[i]), float(stdevs[i])
+
+        return avgdb
+
+    def exportStats(self, outdir, avgdb):
+        """Writes the stats as arrays under outdir. Each trial gets its
+        aggregated timeline, as the sample times and a matrix of counters
+        with one column per stat ID. Each workercount gets the averaged
+        useful work of its trials."""
+        for target, exps in self.aggdb.iteritems():
+            for tgtrial, exp in exps.iteritems():
+                for workercount, entries in exp.iteritems():
+                    if self.arrays:
+                        timeline = statsarrays.StatsTimeline(
+                            [float(self.samplerate * i) for i in range(len(entries))], entries)
+                    else:
+                        timeline = statsarrays.buildTimeline(
+                            (float(entry.timestamp), entry.stats) for entry in entries)
+                    arrayexport.saveArrays(
+                        arrayexport.getExportDir(outdir, target, workercount, tgtrial), {
+                            "stats-times": timeline.timestamps,
+                            "stats": timeline.counters
+                            })
+
+        for target, tgdata in avgdb.iteritems():
+            for workercount, entries in tgdata.iteritems():
+                timestamps = sorted(entries.keys())
+                arrayexport.saveArrays(arrayexport.getExportDir(outdir, target, workercount), {
+                        "usefulwork-times": [float(t) for t in timestamps],
+                        "usefulwork-average": [int(entries[t].average) for t in timestamps],
+                        "usefulwork-stdev": [float(entries[t].stdev) for t in timestamps],
+                        "usefulwork-count": [len(entries[t].entries) for t in timestamps]
+                        })
+
+    def printUsefulWork(self, aggdb, target="memcached"):
+        tgdata = aggdb[target]
+        for workercount in sorted(tgdata.keys()):
+            entries = tgdata[workercount]
+            print "%d:" % workercount,
+            for timestamp in sorted(entries.keys()):
+                entry = entries[timestamp]
+                print "%d=%d,%.4f%%,%d" % (
+                    timestamp, int(entry.average), 
+                    100.0*int(entry.stdev)/int(entry.average) if int(entry.average) else 0.0, 
+                    len(entry.entries)),
+            print
@@ -0,0 +1,162 @@
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+"""
+Implements the ProcessSupervisor class, which waits for child processes to
+exit without polling them.
+"""
+
+import os
+import errno
+import fcntl
+import select
+import signal
+import threading
+import time
+
+
+class ProcessSupervisor:
+    """Tracks a set of child processes and reports their exits as they
+    happen. SIGCHLD writes to a pipe (through signal.set_wakeup_fd), which
+    wait() selects on, and each wakeup reaps the exited children with
+    waitpid(-1), so the cost follows the number of exits, not the number
+    of processes.
+
+    While started, the supervisor reaps every child of this process. The
+    Popen objects it does not track then see their exit codes as 0. It must
+    be started and used from the main thread, except for report(), which
+    the other threads use for the processes the supervisor cannot wait
+    for, such as the workers of a HostSession."""
+
+    def __init__(self):
+        self.processes = { }
+        self.exitcodes = { }
+        self._pipe = None
+        self._oldHandler = None
+        self._reported = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._pipe = os.pipe()
+        for fd in self._pipe:
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        # The default disposition of SIGCHLD ignores it, and a Python handler
+        # is needed for the wakeup fd to be written
+        self._oldHandler = signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        # Restart the system calls SIGCHLD interrupts in the other threads
+        signal.siginterrupt(signal.SIGCHLD, False)
+        signal.set_wakeup_fd(self._pipe[1])
+
+    def stop(self):
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, self._oldHandler)
+        for fd in self._pipe:
+            os.close(fd)
+        self._pipe = None
+
+    def add(self, key, proc):
+        """Supervises a Popen object. Its exit is reported under key."""
+        self.processes[proc.pid] = (key, proc)
+
+    def report(self, key, exitcode):
+        """Reports the exit of a process that is not a child of this
+        one. It is returned by the next wait()."""
+        self._lock.acquire()
+        self._reported.append((key, exitcode))
+        self._lock.release()
+
+        pipe = self._pipe
+        if pipe:
+            try:
+                os.write(pipe[1], "\0")
+            except OSError:
+                # The pipe is full, or closed by stop()
+                pass
+
+    def wait(self, timeout):
+        """Waits at most timeout seconds for supervised processes to exit.
+        Returns the list of (key, exit code) of the processes that exited,
+        which is empty if the timeout expired first. As with Popen, the
+        exit code of a process killed by a signal is minus the signal."""
+        deadline = time.time() + max(timeout, 0)
+        while True:
+            exited = self._reap() + self._popReported()
+            remaining = deadline - time.time()
+            if exited or remaining <= 0:
+                return exited
+            try:
+                select.select([self._pipe[0]], [], [], remaining)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+            self._drain()
+
+    def _drain(self):
+        try:
+            while os.read(self._pipe[0], 4096):
+                pass
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                raise
+
+    def _popReported(self):
+        self._lock.acquire()
+        exited, self._reported = self._reported, []
+        self._lock.release()
+        for key, exitcode in exited:
+            self.exitcodes[key] = exitcode
+        return exited
+
+    def _reap(self):
+        exited = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    break
+                raise
+            if pid == 0:
+                break
+            if pid not in self.processes:
+                continue
+
+            key, proc = self.processes.pop(pid)
+            if os.WIFSIGNALED(status):
+                proc.returncode = -os.WTERMSIG(status)
+            else:
+                proc.returncode = os.WEXITSTATUS(status)
+            self.exitcodes[key] = proc.returncode
+            exited.append((key, proc.returncode))
+        return exited
@@ -0,0 +1,242 @@
+#
+# Cloud9 Parallel Symbolic Execution Engine
+# 
+# Copyright (c) 2011, Dependable Systems Laboratory, EPFL
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#     * Redistributions of source code must retain the above copyright
+#       notice, this list of conditions and the following disclaimer.
+#     * Redistributions in binary form must reproduce the above copyright
+#       notice, this list of conditions and the following disclaimer in the
+#       documentation and/or other materials provided with the distribution.
+#     * Neither the name of the Dependable Systems Laboratory, EPFL nor the
+#       names of its contributors may be used to endorse or promote products
+#       derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE DEPENDABLE SYSTEMS LABORATORY, EPFL BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# All contributors are listed in CLOUD9-AUTHORS file.
+#
+
+"""
+Implements the ResultsWarehouse class, a local SQLite store of the coverage,
+stats and load balancer timelines mined from the experiments.
+"""
+
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+DEFAULT_WAREHOUSE_PATH = "./results.db"
+
+_DATE_RE = re.compile(r"-(\d{4})-(\d{2})-(\d{2})-(\d{2})-(\d{2})-(\d{2})$")
+_AGE_RE = re.compile(r"^(\d+)d$")
+
+# The kinds of timelines, with the table of their points
+_POINT_TABLES = {
+    "coverage": ("coverage", ("timestamp", "coverage")),
+    "stats": ("stats", ("sample", "timestamp", "stat", "value")),
+    "lbtotals": ("lbtotals", ("timestamp", "total")),
+    "lbtransfers": ("lbtransfers", ("timestamp", "amount"))
+    }
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS series (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        filter TEXT NOT NULL,
+        resolution TEXT NOT NULL,
+        testdir TEXT NOT NULL,
+        target TEXT NOT NULL,
+        workercount INTEGER NOT NULL,
+        tgcount INTEGER NOT NULL,
+        worker INTEGER NOT NULL,
+        host TEXT,
+        date TEXT,
+        UNIQUE (kind, filter, resolution, testdir, target, workercount, tgcount, worker)
+    );
+    CREATE INDEX IF NOT EXISTS series_target ON series (kind, target, workercount, date);
+    CREATE INDEX IF NOT EXISTS series_testdir ON series (kind, testdir);
+
+    CREATE TABLE IF NOT EXISTS coverage (series INTEGER NOT NULL, timestamp REAL, coverage REAL);
+    CREATE INDEX IF NOT EXISTS coverage_series ON coverage (series);
+    CREATE TABLE IF NOT EXISTS stats (series INTEGER NOT NULL, sample INTEGER, timestamp REAL,
+                                      stat INTEGER, value INTEGER);
+    CREATE INDEX IF NOT EXISTS stats_series ON stats (series);
+    CREATE TABLE IF NOT EXISTS lbtotals (series INTEGER NOT NULL, timestamp REAL, total INTEGER);
+    CREATE INDEX IF NOT EXISTS lbtotals_series ON lbtotals (series);
+    CREATE TABLE IF NOT EXISTS lbtransfers (series INTEGER NOT NULL, timestamp REAL, amount INTEGER);
+    CREATE INDEX IF NOT EXISTS lbtransfers_series ON lbtransfers (series);
+"""
+
+
+def getExperimentDate(testdir):
+    """Returns the start date of a test, encoded in its directory name by
+    the experiment manager, as a "YYYY-MM-DD HH:MM:SS" string, or None."""
+    match = _DATE_RE.search(testdir)
+    if not match:
+        return None
+    return "%s-%s-%s %s:%s:%s" % match.groups()
+
+def parseDate(value):
+    """Parses a date argument, either "YYYY-MM-DD[ HH:MM:SS]" or an age
+    such as "30d"."""
+    if value is None:
+        return None
+    match = _AGE_RE.match(value)
+    if match:
+        date = datetime.now() - timedelta(days=int(match.group(1)))
+        return date.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+def getFilterName(ffilter):
+    return ",".join(sorted(ffilter)) if ffilter else ""
+
+
+class ResultsWarehouse:
+    """Stores timelines keyed by kind, function filter, resolution and
+    experiment (testdir, target, workercount, tgcount) and worker. The
+    resolution tells how the points were sampled out of the experiment
+    files, e.g. "full", "every-5" or "grid-60". Ingesting a timeline again
+    replaces its points."""
+
+    def __init__(self, path=DEFAULT_WAREHOUSE_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _getSeries(self, kind, ffilter, resolution, key, host):
+        testdir, target, workercount, tgcount, worker = key
+        params = (kind, ffilter, resolution, testdir, target, workercount, tgcount, worker)
+        cursor = self.db.execute("""
+            SELECT id FROM series WHERE kind = ? AND filter = ? AND resolution = ?
+            AND testdir = ? AND target = ? AND workercount = ? AND tgcount = ? AND worker = ?""", params)
+        row = cursor.fetchone()
+        if row is None:
+            cursor = self.db.execute("""
+                INSERT INTO series (kind, filter, resolution, testdir, target, workercount, tgcount,
+                worker, host, date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                params + (host, getExperimentDate(testdir)))
+            return cursor.lastrowid
+
+        table = _POINT_TABLES[kind][0]
+        self.db.execute("DELETE FROM %s WHERE series = ?" % table, (row[0],))
+        self.db.execute("UPDATE series SET host = ? WHERE id = ?", (host, row[0]))
+        return row[0]
+
+    def ingest(self, kind, records, ffilter="", resolution="full"):
+        """Stores (host, key, rows) records, where the key is a (testdir,
+        target, workercount, tgcount, worker) tuple and the rows are tuples
+        of the columns of the points of the kind. Returns the number of
+        timelines stored."""
+        table, columns = _POINT_TABLES[kind]
+        insert = "INSERT INTO %s (series, %s) VALUES (?, %s)" % (
+            table, ", ".join(columns), ", ".join("?" * len(columns)))
+        count = 0
+        with self.db:
+            for host, key, rows in records:
+                series = self._getSeries(kind, ffilter, resolution, key, host)
+                self.db.executemany(insert, ((series,) + tuple(row) for row in rows))
+                count += 1
+        return count
+
+    def _getConditions(self, kind=None, ffilter="", testdirs=None, target=None,
+                       workercount=None, since=None, until=None):
+        conditions = []
+        params = []
+        # The timelines of all the function filters are selected by None
+        if ffilter is not None:
+            conditions.append("series.filter = ?")
+            params.append(ffilter)
+        if kind:
+            conditions.append("series.kind = ?")
+            params.append(kind)
+        if testdirs:
+            conditions.append("series.testdir IN (%s)" % ", ".join("?" * len(testdirs)))
+            params.extend(testdirs)
+        if target:
+            conditions.append("series.target = ?")
+            params.append(target)
+        if workercount:
+            conditions.append("series.workercount = ?")
+            params.append(workercount)
+        if since:
+            conditions.append("series.date >= ?")
+            params.append(parseDate(since))
+        if until:
+            conditions.append("series.date < ?")
+            params.append(parseDate(until))
+        return " AND ".join(conditions) or "1", params
+
+    def findSeries(self, kind, rank=None, **filters):
+        """Returns the (id, key, host, resolution) of the timelines matching
+        the filters, which select the function filter, testdirs, target,
+        workercount and a since/until date range. The rank function orders
+        the resolutions of a timeline, lowest first, and returns None for
+        the unusable ones. Only the best resolution of each timeline is
+        returned."""
+        conditions, params = self._getConditions(kind, **filters)
+        cursor = self.db.execute("""
+            SELECT id, testdir, target, workercount, tgcount, worker, host, resolution
+            FROM series WHERE %s""" % conditions, params)
+
+        series = { }
+        for row in cursor:
+            key = tuple(row[1:6])
+            order = rank(row[7]) if rank else 0
+            if order is None:
+                continue
+            if key not in series or order < series[key][0]:
+                series[key] = (order, (row[0], key, row[6], row[7]))
+
+        return [series[key][1] for key in sorted(series)]
+
+    def getPoints(self, kind, series):
+        table, columns = _POINT_TABLES[kind]
+        return self.db.execute("SELECT %s FROM %s WHERE series = ? ORDER BY rowid" % (
+                ", ".join(columns), table), (series,)).fetchall()
+
+    def load(self, kind, rank=None, **filters):
+        """Yields the (key, host, rows) of the matching timelines, with the
+        same arguments as findSeries."""
+        for series, key, host, _ in self.findSeries(kind, rank=rank, **filters):
+            yield key, host, self.getPoints(kind, series)
+
+    def listExperiments(self, ffilter=None, **filters):
+        """Returns the (date, testdir, target, workercount, tgcount, kinds,
+        number of mined workers) of the experiments with stored timelines,
+        whatever their function filter unless one is given."""
+        conditions, params = self._getConditions(ffilter=ffilter, **filters)
+        return self.db.execute("""
+            SELECT date, testdir, target, workercount, tgcount,
+                   GROUP_CONCAT(DISTINCT kind),
+                   COUNT(DISTINCT CASE WHEN kind IN ('coverage', 'stats') THEN worker END)
+            FROM series WHERE %s
+            GROUP BY testdir, target, workercount, tgcount
+            ORDER BY date, testdir, target, workercount, tgcount""" % conditions, params).fetchall()
+
+    def getMaxCoverage(self, **filters):
+        """Returns the (date, testdir, target, workercount, tgcount, maximum
+        coverage, last timestamp) of the experiments."""
+        conditions, params = self._getConditions("coverage", **filters)
+        return self.db.execute("""
+            SELECT series.date, series.testdir, series.target, series.workercount, series.tgcount,
+                   MAX(coverage.coverage), MAX(coverage.timestamp)
+            FROM series JOIN coverage ON coverage.series = series.id WHERE %s
+            GROUP BY series.testdir, series.target, series.workercount, series.tgcount
+            ORDER BY series.date, series.testdir, series.target, series.workercount,
+                     series.tgcount""" % conditions, params).fetchall()